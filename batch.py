@@ -0,0 +1,104 @@
+## parameter sweeps in one process tree: python batch.py sweep.json [--procs 4] [--out /workspace/batch]
+##
+## sweep.json: {"base": {"geometry": "mbb2d", "hmax": 0.02, "maxiter": 100},
+##              "sweep": {"volfrac": [0.1, 0.15], "rmin": [0.05, 0.08], "epochs": [3, 5]}}
+## Every combination of the sweep values (on top of base and main.DEFAULTS) is one run. Runs that share
+## the mesh and filter (geometry, hmax, hmaxC, N, rmin, arch) share one ProblemSetup: it is built
+## once in this process, then the runs of the group are forked from it, so the meshes, H and the
+## patch graphs are shared copy-on-write instead of being rebuilt per run.
+## Early stopping is off by default; a "convergence" entry in base or sweep (see main.CONVERGENCE) turns it on.
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import traceback
+from time import time
+
+import numpy as np
+import torch
+
+import main as driver
+from problem import ProblemSetup
+
+SETUP_KEYS = ('geometry', 'hmax', 'hmaxC', 'N', 'rmin', 'arch')   ## everything ProblemSetup depends on
+
+_setup = None   ## ProblemSetup of the group being run, inherited by the forked workers
+
+
+def expand(spec):
+    ## sweep specification -> list of complete main() keyword sets
+    names = list(spec.get('sweep', {}))
+    runs = []
+    for values in itertools.product(*(spec['sweep'][k] for k in names)):
+        runs.append(driver.params(**{**spec.get('base', {}), **dict(zip(names, values))}))
+    return runs
+
+
+def group(runs):
+    groups = {}
+    for i, params in enumerate(runs):
+        groups.setdefault(tuple(params[k] for k in SETUP_KEYS), []).append((i, params))
+    return groups
+
+
+def _run(job):
+    i, params, run_dir, threads, seed = job
+    torch.set_num_threads(threads)
+    torch.manual_seed(seed)
+    random.seed(seed)
+    np.random.seed(seed)
+    tic = time()
+    try:
+        driver.main(**params, setup=_setup, results_dir=run_dir, telemetry=os.path.join(run_dir, "telemetry.jsonl"),
+                    checkpoint=os.path.join(run_dir, "checkpoint.pt"))
+        return dict(run=i, status="ok", seconds=time()-tic)
+    except Exception:
+        return dict(run=i, status="failed", seconds=time()-tic, error=traceback.format_exc())
+
+
+def run_batch(spec, out, procs=1, threads=None, seed=42):
+    global _setup
+    runs = expand(spec)
+    threads = threads or max(os.cpu_count()//procs, 1)
+    os.makedirs(out, exist_ok=True)
+    summary = []
+    for g, (key, members) in enumerate(group(runs).items()):
+        params = members[0][1]
+        driver.prepare_output(os.path.join(out, f"scratch_{g}"))
+        tic = time()
+        _setup = ProblemSetup(params['geometry'], params['hmax'], params['hmaxC'], params['N'], params['rmin'],
+                              hier=params['arch'] == 'hier', cache_dir=params['cache_dir'])
+        print(f"group {g}: {dict(zip(SETUP_KEYS, key))}, {len(members)} runs, setup {time()-tic:.1f}s")
+        jobs = []
+        for i, p in members:
+            run_dir = os.path.join(out, f"run_{i:04d}")
+            os.makedirs(run_dir, exist_ok=True)
+            with open(os.path.join(run_dir, "params.json"), "w") as f:
+                json.dump(p, f, indent=1, default=str)   ## mma_dtype
+            jobs.append((i, p, run_dir, threads, seed))
+        ## fork: workers see _setup without pickling; one run per child so every run starts from the same clean state
+        with mp.get_context("fork").Pool(min(procs, len(jobs)), maxtasksperchild=1) as pool:
+            for result in pool.imap_unordered(_run, jobs):
+                result['group'] = g
+                summary.append(result)
+                print(f"run {result['run']:4d}: {result['status']} ({result['seconds']:.0f}s)")
+                if result['status'] != "ok":
+                    print(result['error'])
+        _setup = None
+    with open(os.path.join(out, "batch.json"), "w") as f:
+        json.dump(sorted(summary, key=lambda r: r['run']), f, indent=1)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("spec", help="JSON sweep specification")
+    parser.add_argument("--procs", type=int, default=1, help="concurrent runs")
+    parser.add_argument("--threads", type=int, default=None, help="torch threads per run (default: cpus/procs)")
+    parser.add_argument("--out", default="/workspace/batch")
+    args = parser.parse_args()
+    with open(args.spec) as f:
+        spec = json.load(f)
+    run_batch(spec, args.out, args.procs, args.threads)
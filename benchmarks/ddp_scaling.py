@@ -0,0 +1,40 @@
+## Strong scaling of data-parallel CPU training: python -m benchmarks.ddp_scaling
+import argparse
+import json
+from time import perf_counter
+
+import numpy as np
+import torch
+
+from benchmarks.synthetic import patch_dataset
+from model import training
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=200000)
+    parser.add_argument("--patch", type=int, default=200)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--out", default="ddp_scaling.json")
+    args = parser.parse_args()
+
+    torch.manual_seed(42)
+    dataset = patch_dataset(args.cells, args.patch)
+    batch_size = int(np.ceil(len(dataset)/10))
+    device = torch.device("cpu")
+    rows = []
+    for n_procs in args.procs:
+        tic = perf_counter()
+        train_hist, _, _ = training(dataset, batch_size, [512, 1024, 512], 3, 5e-4, args.epochs, device, n_procs=n_procs)
+        t = perf_counter()-tic
+        rows.append({'procs': n_procs, 'time': t, 'loss': train_hist[-1]})
+        rows[-1]['speedup'] = rows[0]['time']/t
+        rows[-1]['efficiency'] = rows[-1]['speedup']/(n_procs/rows[0]['procs'])
+        print(f"procs: {n_procs: 3d},\ttime: {t:.3f}s,\tspeedup: {rows[-1]['speedup']:.2f},\tefficiency: {rows[-1]['efficiency']:.2f}")
+    with open(args.out, "w") as f:
+        json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
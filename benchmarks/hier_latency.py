@@ -0,0 +1,68 @@
+## MyGNN vs HierGNN accuracy and prediction cost: python -m benchmarks.hier_latency
+## Both are trained on one synthetic snapshot (seed 0) and scored (theta) on another (seed 1).
+import argparse
+import json
+from time import perf_counter
+
+import numpy as np
+import torch
+import torch_geometric as pyg
+
+from benchmarks.precision import theta
+from benchmarks.synthetic import patch_dataset
+from model import inputs, training
+
+
+def gcn_flops(convs, n_nodes, n_edges):
+    ## dense transform + edge-wise aggregation of each GCNConv
+    return sum(2*n*conv.in_channels*conv.out_channels + 2*e*conv.out_channels for conv, n, e in zip(convs, n_nodes, n_edges))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=100000)
+    parser.add_argument("--patch", type=int, default=200)
+    parser.add_argument("--coarsen", type=int, default=4)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", default="hier_latency.json")
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    n_hidden = [512, 1024, 512]
+    rows = []
+    for name, arch in [('MyGNN', 'gcn'), ('HierGNN', 'hier')]:
+        coarsen = args.coarsen if arch == 'hier' else None
+        dataset = patch_dataset(args.cells, args.patch, seed=0, coarsen=coarsen)
+        test = patch_dataset(args.cells, args.patch, seed=1, coarsen=coarsen)
+        batch = next(iter(pyg.loader.DataLoader(test, batch_size=len(test))))
+        torch.manual_seed(42)
+        _, val_hist, net = training(dataset, int(np.ceil(len(dataset)/10)), n_hidden, 3, 5e-4, args.epochs, device, arch=arch)
+        net.eval()
+        x = inputs(batch, device)
+        nf, ef = batch.num_nodes, batch.edge_index.shape[1]
+        convs = [net.input, *net.hidden, net.output]
+        if arch == 'gcn':
+            flops = gcn_flops(convs, [nf]*len(convs), [ef]*len(convs))
+        else:
+            nc, ec = int(batch.num_coarse.sum()), batch.coarse_edge_index.shape[1]
+            convs.insert(1, net.coarse_input)
+            flops = gcn_flops(convs, [nf] + [nc]*(len(net.hidden) + 1) + [nf], [ef] + [ec]*(len(net.hidden) + 1) + [ef])
+        with torch.no_grad():
+            yhat = net(*x).numpy()[:, 0]
+            times = []
+            for _ in range(args.repeat):
+                tic = perf_counter()
+                net(*x)
+                times.append(perf_counter()-tic)
+        rows.append({'model': name, 'median': float(np.median(times)), 'gflops': flops/1e9,
+                     'params': sum(p.numel() for p in net.parameters()), 'val_loss': val_hist[-1],
+                     'theta': theta(yhat, batch.y.numpy()[:, 0])})
+        print(f"{name:8s} median: {rows[-1]['median']*1e3:.2f}ms,\tGFLOPs: {rows[-1]['gflops']:.2f},\tparams: {rows[-1]['params']},"
+              f"\ttheta: {rows[-1]['theta']:.2f}")
+    with open(args.out, "w") as f:
+        json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+## Latency and accuracy of the inference backends: python -m benchmarks.inference_backends
+import argparse
+import json
+from time import perf_counter
+
+import numpy as np
+import torch
+import torch_geometric as pyg
+
+from benchmarks.synthetic import patch_dataset
+from inference import BACKENDS, Predictor
+from model import MyGNN
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=100000)
+    parser.add_argument("--patch", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--out", default="inference_backends.json")
+    args = parser.parse_args()
+
+    torch.manual_seed(42)
+    dataset = patch_dataset(args.cells, args.patch)
+    batch = next(iter(pyg.loader.DataLoader(dataset, batch_size=len(dataset))))
+    net = MyGNN(batch.x.shape[1], [512, 1024, 512], 3, 0.1).eval()
+    with torch.no_grad():
+        reference = net(batch.x, batch.edge_index)
+
+    rows = []
+    for backend in args.backends:
+        predictor = Predictor(net, backend)
+        yhat = predictor(batch.x, batch.edge_index)   ## export + warm-up
+        times = []
+        for _ in range(args.repeat):
+            tic = perf_counter()
+            predictor(batch.x, batch.edge_index)
+            times.append(perf_counter()-tic)
+        rows.append({'backend': backend, 'median': float(np.median(times)), 'p90': float(np.percentile(times, 90)),
+                     'max_abs_err': (yhat - reference).abs().max().item(), 'rel_err': predictor.error, 'fallback': predictor.fn is predictor.net and backend != 'eager'})
+        print(f"{backend:12s} median: {rows[-1]['median']*1e3:.2f}ms,\tp90: {rows[-1]['p90']*1e3:.2f}ms,\terr: {rows[-1]['max_abs_err']:.2e}")
+    with open(args.out, "w") as f:
+        json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+## hot-kernel timings on generated unit meshes (no gmsh):
+##   python -m benchmarks.kernels run [--cells 10000 100000 1000000] [--dims 2 3] [--out kernels.json]
+##   python -m benchmarks.kernels compare base.json new.json [--tol 0.15]   (exit code 1 on regressions)
+import argparse
+import json
+import os
+import platform
+import sys
+from time import perf_counter, time
+
+import fenics as fe
+import numpy as np
+import torch
+
+import fastmma
+from fem import input_assemble, oc, output_assemble
+from model import PatchTracker, generate_dataset, graph_partitioning, predict, training
+from utils import (PatchIndex, compute_tetra_area, compute_triangle_area,
+                   convolution_operator, dropping, field, filter,
+                   find_adjacent_tetrahedra, map_density, sync,
+                   transfer_operator)
+
+ONCE = {'convolution_operator', 'graph_partitioning', 'find_adjacent_tetrahedra', 'training_epoch'}   ## setup-type, timed once
+
+
+def unit_mesh(cells, dim):
+    ## UnitSquareMesh has 2n^2 triangles, UnitCubeMesh 6n^3 tetrahedra
+    if dim == 2:
+        n = max(int(round(np.sqrt(cells/2))), 1)
+        return fe.UnitSquareMesh(n, n)
+    n = max(int(round((cells/6)**(1/3))), 1)
+    return fe.UnitCubeMesh(n, n, n)
+
+
+def patches(center, N):
+    ## cells binned into a regular grid of blocks with about N cells each (stand-in for the gmsh partition)
+    dim = center.shape[1]
+    k = max(int(round((len(center)/N)**(1/dim))), 1)
+    block = np.minimum((center*k).astype(int), k-1) @ (k**np.arange(dim))
+    order = np.argsort(block, kind="stable")
+    elems = [e for e in np.split(order, np.flatnonzero(np.diff(block[order])) + 1) if len(e)]
+    return {'elems': elems, 'index': PatchIndex(elems)}
+
+
+def fixture(cells, dim, N=200, seed=0):
+    rng = np.random.default_rng(seed)
+    f = {}
+    f['mesh'] = mesh = unit_mesh(cells, dim)
+    f['meshC'] = meshC = unit_mesh(cells/4**dim, dim)   ## hmaxC = 4 hmax as in main.py
+    f['V'] = fe.VectorFunctionSpace(mesh, "CG", 1)
+    f['F'] = F = fe.FunctionSpace(mesh, "DG", 0)
+    f['VC'] = fe.VectorFunctionSpace(meshC, "CG", 1)
+    f['FC'] = FC = fe.FunctionSpace(meshC, "CG", 1)
+    f['v2dC'] = fe.vertex_to_dof_map(FC)
+    f['coords'], f['trias'] = coords, trias = mesh.coordinates(), mesh.cells()
+    f['center'] = center = coords[trias].mean(1)
+    f['areas'] = compute_triangle_area(coords[trias]) if dim == 2 else compute_tetra_area(coords[trias])
+    f['rmin'] = 2.5*mesh.hmax()
+    f['part_info'] = patches(center, N)
+
+    f['rhoh'] = fe.Function(F)
+    rho = rng.uniform(0, 1, len(center))
+    rho[center[:, 0] > 0.7] = 0   ## void region for the patch dropping
+    field(f['rhoh'])[:] = rho
+    sync(f['rhoh'])
+    f['dc'] = fe.Function(F)
+    field(f['dc'])[:] = -rng.uniform(0.1, 1, len(center))
+    sync(f['dc'])
+    f['uhC'] = fe.Function(f['VC'])
+    field(f['uhC'])[:] = rng.uniform(-1e-3, 1e-3, len(field(f['uhC'])))
+    sync(f['uhC'])
+    f['rhohC'] = fe.Function(FC)
+    return f
+
+
+def kernels(f, n_hidden, device):
+    ## (name, zero-argument call) in dependency order; later kernels reuse earlier results
+    out = {}
+    n = len(f['center'])
+
+    def conv():
+        out['H'] = convolution_operator(f['center'], f['rmin'])
+        out['Hs'] = out['H']@np.ones(n)
+        out['dv'] = fe.Function(f['F'])
+        field(out['dv'])[:] = filter(out['H'], out['Hs'], f['areas'])
+        sync(out['dv'])
+    yield 'convolution_operator', conv
+    yield 'filter', lambda: filter(out['H'], out['Hs'], field(f['rhoh']))
+    yield 'oc', lambda: oc(f['rhoh'], f['dc'], out['dv'], f['mesh'], out['H'], out['Hs'], 0.3, f['areas'])
+
+    xval = field(f['rhoh']).reshape(-1, 1).clip(1e-3, 1)
+    mma = (1, n, 1, xval, np.zeros((n, 1)), np.ones((n, 1)), xval, xval, 1.0, field(f['dc']).reshape(-1, 1),
+           np.array([[-0.1]]), f['areas'].reshape(1, -1), np.zeros((n, 1)), np.ones((n, 1)),
+           1.0, np.zeros((1, 1)), 1e5*np.ones((1, 1)), np.zeros((1, 1)), 0.2)
+    yield 'mmasub', lambda: fastmma.mmasub(*mma)
+    if f['center'].shape[1] == 3:
+        yield 'find_adjacent_tetrahedra', lambda: find_adjacent_tetrahedra(f['mesh'])
+
+    def partition():
+        out['graphs'] = graph_partitioning(f['coords'], f['trias'], f['part_info'], f['center'], f['mesh'])
+    yield 'graph_partitioning', partition
+    out['transfer'] = transfer_operator(f['center'], f['meshC'].coordinates(), f['meshC'].cells() if f['center'].shape[1] == 2 else None)
+
+    def assemble():
+        out['x'], out['scaler'] = input_assemble(f['rhoh'], f['uhC'], f['V'], f['F'], f['FC'], f['v2dC'], f['center'],
+                                                 transfer=out['transfer'])
+    yield 'input_assemble', assemble
+    yield 'map_density', lambda: map_density(f['rhoh'], f['rhohC'], f['mesh'], f['meshC'], None, f['v2dC'])
+    yield 'dropping', lambda: dropping(f['part_info'], f['rhoh'])
+
+    def epoch():
+        y, out['scalers'], _ = output_assemble(f['dc'], 0, f['F'], k=2)
+        dataset = generate_dataset(out['x'], y, out['graphs'], f['part_info']['index'])
+        batch_size = int(np.ceil(len(dataset)/10))
+        _, _, out['net'] = training(dataset, batch_size, n_hidden, 3, 5e-4, 1, device)
+    yield 'training_epoch', epoch
+    index = f['part_info']['index']
+    yield 'inference', lambda: predict(out['net'], out['x'], PatchTracker(index, n), out['graphs'], index,
+                                       out['scalers'], device)   ## fresh tracker: every patch predicted
+
+
+def run(cells, dim, repeat=5, n_hidden=(512, 1024, 512), skip=()):
+    torch.manual_seed(0)
+    tic = perf_counter()
+    f = fixture(cells, dim)
+    print(f"{dim}D, {len(f['center'])} cells, {len(f['part_info']['elems'])} patches, fixture {perf_counter()-tic:.1f}s")
+    rows = []
+    for name, call in kernels(f, list(n_hidden), torch.device("cpu")):
+        times = []
+        for _ in range(1 if name in ONCE else repeat + 1):   ## first call of repeated kernels is warm-up
+            tic = perf_counter()
+            call()
+            times.append(perf_counter()-tic)
+        times = times if name in ONCE else times[1:]
+        if name in skip:   ## still run (later kernels need the results), not reported
+            continue
+        rows.append({'kernel': name, 'dim': dim, 'cells': len(f['center']), 'requested': cells,
+                     'median': float(np.median(times)), 'min': float(np.min(times)), 'repeat': len(times)})
+        print(f"  {name:26s} median: {rows[-1]['median']*1e3:10.2f}ms,\tmin: {rows[-1]['min']*1e3:10.2f}ms")
+    return rows
+
+
+def compare(base, new, tol=0.15):
+    ## median ratio new/base per (kernel, dim, requested cells); > 1+tol is a regression
+    key = lambda r: (r['kernel'], r['dim'], r['requested'])
+    ref = {key(r): r for r in base['results']}
+    regressions = []
+    print(f"{'kernel':26s} {'dim':>3s} {'cells':>9s} {'base ms':>10s} {'new ms':>10s} {'ratio':>6s}")
+    for r in new['results']:
+        b = ref.get(key(r))
+        if b is None:
+            continue
+        ratio = r['median']/b['median']
+        flag = ratio > 1 + tol
+        if flag:
+            regressions.append((key(r), ratio))
+        print(f"{r['kernel']:26s} {r['dim']:3d} {r['cells']:9d} {b['median']*1e3:10.2f} {r['median']*1e3:10.2f} {ratio:6.2f}"
+              + ("  REGRESSION" if flag else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run")
+    p.add_argument("--cells", type=int, nargs="+", default=[10000, 100000, 1000000])
+    p.add_argument("--dims", type=int, nargs="+", default=[2, 3])
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--hidden", type=int, nargs="+", default=[512, 1024, 512])
+    p.add_argument("--skip", nargs="*", default=[], help="kernels left out of the results")
+    p.add_argument("--out", default="kernels.json")
+    c = sub.add_parser("compare")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--tol", type=float, default=0.15, help="allowed relative slowdown of the median")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.base) as fb, open(args.new) as fn:
+            regressions = compare(json.load(fb), json.load(fn), args.tol)
+        print(f"{len(regressions)} regressions")
+        sys.exit(1 if regressions else 0)
+
+    rows = []
+    for dim in args.dims:
+        for cells in args.cells:
+            rows += run(cells, dim, args.repeat, args.hidden, args.skip)
+    meta = {'time': time(), 'host': platform.node(), 'python': platform.python_version(), 'numpy': np.__version__,
+            'torch': torch.__version__, 'dolfin': fe.__version__, 'cpus': os.cpu_count(),
+            'threads': torch.get_num_threads()}
+    with open(args.out, "w") as f:
+        json.dump({'meta': meta, 'results': rows}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+## flat-array (and thread-chunked) MMA vs MMA.mmasub: python -m benchmarks.mma [--check-only]
+import argparse
+import json
+from time import perf_counter
+
+import numpy as np
+
+import fastmma
+import MMA
+
+
+def problem(n, seed=0):
+    ## separable compliance-like objective sum(k/x^3) under a volume constraint, m=1
+    rng = np.random.default_rng(seed)
+    k = rng.uniform(0.1, 1.0, n)
+    v = rng.uniform(0.5, 1.5, n)/n
+    volfrac = 0.3
+
+    def evaluate(x):
+        f0val = (k/x**3).sum()
+        df0dx = (-3*k/x**4).reshape(-1, 1)
+        fval = np.array([[(v*x).sum() - volfrac*v.sum()]])
+        return f0val, df0dx, fval, v.reshape(1, -1)
+    return evaluate
+
+
+def run(sub, n, iters, seed=0, **kwargs):
+    ## iters outer MMA iterations with the driver settings of main.py; returns the iterates and times
+    evaluate = problem(n, seed)
+    m = 1
+    xmin, xmax = 1e-3*np.ones((n, 1)), np.ones((n, 1))
+    xval = 0.3*np.ones((n, 1))
+    xold1, xold2 = xval.copy(), xval.copy()
+    low, upp = np.ones((n, 1)), np.ones((n, 1))
+    a0, a, c, d, move = 1.0, np.zeros((m, 1)), 100000*np.ones((m, 1)), np.zeros((m, 1)), 0.2
+    xs, times = [], []
+    for it in range(1, iters+1):
+        f0val, df0dx, fval, dfdx = evaluate(xval.ravel())
+        tic = perf_counter()
+        xmma, _, _, _, _, _, _, _, _, low, upp = \
+            sub(m, n, it, xval, xmin, xmax, xold1, xold2, f0val, df0dx, fval, dfdx, low, upp, a0, a, c, d, move, **kwargs)
+        times.append(perf_counter()-tic)
+        xold2, xold1 = xold1, xval.copy()
+        xval = xmma.astype(np.float64)
+        xs.append(xval.ravel().copy())
+    return xs, times
+
+
+def deviation(ref, new):
+    return max(np.abs(r - x).max()/np.abs(r).max() for r, x in zip(ref, new))
+
+
+def check(n=2000, iters=10, rtol=1e-6, rtol32=1e-3, threads=4):
+    ## the flat solver reproduces the iterates of MMA.mmasub (also chunked over threads), see tests/test_fastmma.py
+    ref, _ = run(MMA.mmasub, n, iters)
+    err = {'float64': deviation(ref, run(fastmma.mmasub, n, iters)[0]),
+           'float32': deviation(ref, run(fastmma.mmasub, n, iters, dtype=np.float32)[0])}
+    solver = fastmma.MMA(n, 1, threads=threads, chunk=n//7)   ## uneven chunks
+    err['threads'] = deviation(ref, run(lambda m, n, it, *args: solver_sub(solver, it, *args), n, iters)[0])
+    print(f"n={n}, {iters} iterations: max rel. deviation", {k: f"{v:.2e}" for k, v in err.items()})
+    assert err['float64'] < rtol and err['threads'] < rtol and err['float32'] < rtol32, f"fastmma deviates from MMA.mmasub: {err}"
+    return err
+
+
+def solver_sub(solver, it, *args):
+    col = lambda v: np.reshape(v, (-1, 1))
+    return [col(v) for v in solver.sub(it, *args)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000, 5000000])
+    parser.add_argument("--max-ref", type=int, default=1000000, help="largest n timed with MMA.mmasub")
+    parser.add_argument("--iters", type=int, default=5)
+    parser.add_argument("--threads", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--check-only", action="store_true")
+    parser.add_argument("--out", default="mma.json")
+    args = parser.parse_args()
+
+    err = check()
+    if args.check_only:
+        return
+    rows = []
+    for n in args.sizes:
+        row = {'n': n}
+        if n <= args.max_ref:
+            row['mmasub'] = np.mean(run(MMA.mmasub, n, args.iters)[1])
+        row['fast'] = np.mean(run(fastmma.mmasub, n, args.iters)[1])
+        row['fast_f32'] = np.mean(run(fastmma.mmasub, n, args.iters, dtype=np.float32)[1])
+        for threads in args.threads:
+            row[f'fast_t{threads}'] = np.mean(run(fastmma.mmasub, n, args.iters, threads=threads)[1])
+        if 'mmasub' in row:
+            row['speedup'] = row['mmasub']/row['fast']
+        print(row)
+        rows.append(row)
+    with open(args.out, "w") as f:
+        json.dump({'check': err, 'timings': rows}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
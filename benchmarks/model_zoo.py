@@ -0,0 +1,88 @@
+## Accuracy per millisecond of the registered architectures: python -m benchmarks.model_zoo [--snapshots DIR]
+## Every architecture is scored (theta) on a snapshot it was not trained on: the last recorded one, or a
+## synthetic snapshot of another seed.
+import argparse
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+import torch
+import torch_geometric as pyg
+from torch_geometric.data import Data
+
+from benchmarks.precision import theta
+from benchmarks.synthetic import grid_patches
+from model import ARCHS, generate_dataset, inputs, training
+from store import SnapshotStore
+from utils import PatchIndex
+
+
+def load_snapshots(path):
+    ## pairs of (features, targets) recorded by main on fine iterations
+    x_store = SnapshotStore.load(os.path.join(path, "input"))
+    y_store = SnapshotStore.load(os.path.join(path, "output"))
+    patches = torch.load(os.path.join(path, "patches.pt"), weights_only=False)
+    x_index = {tag: i for i, tag in enumerate(x_store.tags)}
+    pairs = [(x_store[x_index[tag]], y_store[i]) for i, tag in enumerate(y_store.tags) if tag in x_index]
+    return pairs, patches['partitioned_graphs'], patches['elems']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshots", default=None, help="snapshot directory of a finished run")
+    parser.add_argument("--cells", type=int, default=50000)
+    parser.add_argument("--archs", nargs="+", default=list(ARCHS))
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--out", default="model_zoo.json")
+    args = parser.parse_args()
+
+    if args.snapshots:
+        pairs, partitioned_graphs, part_elems = load_snapshots(args.snapshots)
+    else:
+        pairs = []
+        for seed in (0, 1):   ## same mesh and patches, independent inputs and targets
+            x, y, part_elems, partitioned_graphs, _ = grid_patches(args.cells, seed=seed, coarsen=4)
+            pairs.append((x, y))
+    if len(pairs) < 2:
+        raise ValueError("need at least two snapshots: one to train on and a held-out one to score")
+    (x_test, y_test), train_pairs = pairs[-1], pairs[:-1]
+    index = PatchIndex(part_elems)
+    fine_graphs = [Data(edge_index=g.edge_index) for g in partitioned_graphs]   ## without the coarse level
+    batch_size = int(np.ceil(len(part_elems)/10))
+    device = torch.device("cpu")
+
+    rows = []
+    for arch in args.archs:
+        if arch == 'hier' and 'coarse_nodes' not in partitioned_graphs[0]:
+            print("hier skipped: snapshots were recorded without the coarse level (arch='hier')")
+            continue
+        graphs = partitioned_graphs if arch == 'hier' else fine_graphs
+        dataset = sum([generate_dataset(x, y, graphs, index) for x, y in train_pairs], [])
+        test = generate_dataset(x_test, None, graphs, index)
+        test_batch = next(iter(pyg.loader.DataLoader(test, batch_size=len(test))))
+        torch.manual_seed(42)
+        tic = perf_counter()
+        _, val_hist, net = training(dataset, batch_size, [512, 1024, 512], 3, 5e-4, args.epochs, device, arch=arch)
+        t_train = perf_counter()-tic
+        net.eval()
+        x_in = inputs(test_batch, device)
+        with torch.no_grad():
+            yhat = net(*x_in)
+            times = []
+            for _ in range(args.repeat):
+                tic = perf_counter()
+                net(*x_in)
+                times.append(perf_counter()-tic)
+        y_pred = np.zeros(len(y_test))
+        y_pred[test_batch.global_idx] = yhat.numpy()[:, 0]
+        rows.append({'arch': arch, 'train': t_train, 'latency': float(np.median(times)), 'val_loss': val_hist[-1],
+                     'params': sum(p.numel() for p in net.parameters()), 'theta': theta(y_pred, np.asarray(y_test)[:, 0])})
+        print(f"{arch:8s} train: {t_train:.2f}s,\tlatency: {rows[-1]['latency']*1e3:.2f}ms,\tparams: {rows[-1]['params']},\ttheta: {rows[-1]['theta']:.3f}")
+    with open(args.out, "w") as f:
+        json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+## float32 vs bfloat16 training/inference: python -m benchmarks.precision
+import argparse
+import json
+from time import perf_counter
+
+import numpy as np
+import torch
+import torch_geometric as pyg
+
+from benchmarks.synthetic import patch_dataset
+from inference import Predictor
+from model import training
+
+
+def theta(v1, v2):
+    ## same angle error as utils.compute_theta_error, on plain arrays
+    return np.arccos(np.dot(v1, v2)/np.linalg.norm(v1)/np.linalg.norm(v2))*180/np.pi
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=100000)
+    parser.add_argument("--patch", type=int, default=200)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--out", default="precision.json")
+    args = parser.parse_args()
+
+    dataset = patch_dataset(args.cells, args.patch)
+    batch = next(iter(pyg.loader.DataLoader(dataset, batch_size=len(dataset))))
+    batch_size = int(np.ceil(len(dataset)/10))
+    device = torch.device("cpu")
+    rows, preds = [], {}
+    for precision in ('fp32', 'bf16'):
+        torch.manual_seed(42)
+        tic = perf_counter()
+        _, val_hist, net = training(dataset, batch_size, [512, 1024, 512], 3, 5e-4, args.epochs, device, precision=precision)
+        t_train = perf_counter()-tic
+        predictor = Predictor(net, precision=precision)
+        predictor(batch.x, batch.edge_index)
+        tic = perf_counter()
+        preds[precision] = predictor(batch.x, batch.edge_index).numpy()[:, 0]
+        t_pred = perf_counter()-tic
+        rows.append({'precision': precision, 'train': t_train, 'pred': t_pred, 'val_loss': val_hist[-1],
+                     'theta_vs_target': theta(preds[precision], batch.y.numpy()[:, 0])})
+    rows[1]['train_speedup'] = rows[0]['train']/rows[1]['train']
+    rows[1]['pred_speedup'] = rows[0]['pred']/rows[1]['pred']
+    rows[1]['theta_vs_fp32'] = theta(preds['bf16'], preds['fp32'])
+    for row in rows:
+        print(row)
+    with open(args.out, "w") as f:
+        json.dump(rows, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+## surrogate vs pure-FE baseline over a sweep of mesh sizes:
+##   python -m benchmarks.scaling --geometry hook3d --hmax 0.12 0.09 0.06 0.045 --maxiter 100 --out scaling
+## Both modes run exactly maxiter iterations unless --convergence; speedups compare the loop time (total - setup),
+## so whether the mesh artifact cache was warm for a run does not enter them.
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("surrogate", "baseline")
+
+
+def run(geometry, hmax, mode, maxiter, results_dir, timeout=None, convergence=False, overrides=None):
+    ## one main.py run in a fresh process (own imports, JIT and meshing, like a real job);
+    ## overrides: DEFAULTS entries passed as --set KEY=JSON
+    cmd = [sys.executable, os.path.join(ROOT, "main.py"), "--geometry", geometry, "--hmax", str(hmax),
+           "--maxiter", str(maxiter), "--results-dir", results_dir]
+    for key, value in (overrides or {}).items():
+        cmd += ["--set", f"{key}={json.dumps(value)}"]
+    if mode == "baseline":
+        cmd.append("--baseline")
+    if convergence:
+        cmd.append("--convergence")
+    tic = perf_counter()
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, timeout=timeout)
+    wall = perf_counter() - tic
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:], file=sys.stderr)
+        return dict(mode=mode, hmax=hmax, failed=proc.returncode, wall=wall)
+    with open(os.path.join(results_dir, "run.json")) as f:
+        row = json.load(f)
+    row['wall'] = wall   ## including interpreter start-up and imports
+    row['loop'] = row['total'] - row['setup']   ## setup depends on the artifact cache (the first run of an hmax fills it)
+    row['per_iteration'] = row['loop']/max(row['iterations'], 1)
+    return row
+
+
+def table(rows):
+    ## one line per hmax: both modes side by side, speedup = baseline / surrogate
+    by = {(r['hmax'], r['mode']): r for r in rows if 'failed' not in r}
+    out = []
+    for hmax in sorted({r['hmax'] for r in rows}, reverse=True):
+        s, b = by.get((hmax, "surrogate")), by.get((hmax, "baseline"))
+        if s is None or b is None:
+            continue
+        out.append(dict(hmax=hmax, cells=s['cells'],
+                        surrogate_loop=s['loop'], baseline_loop=b['loop'],
+                        surrogate_setup=s['setup'], baseline_setup=b['setup'],
+                        speedup=b['loop']/s['loop'],
+                        speedup_per_iteration=b['per_iteration']/s['per_iteration'],
+                        surrogate_fine=s['fine_solves'], baseline_fine=b['fine_solves'],
+                        surrogate_iterations=s['iterations'], baseline_iterations=b['iterations'],
+                        comp_ratio=s['comp']/b['comp'],
+                        surrogate_rss_mb=s['peak_rss_kb']/1024, baseline_rss_mb=b['peak_rss_kb']/1024,
+                        surrogate_training=s['phases'].get('training', 0.0), baseline_fine_time=b['phases'].get('fine', 0.0)))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--geometry", default="hook3d")
+    parser.add_argument("--hmax", type=float, nargs="+", default=[0.12, 0.09, 0.06, 0.045])
+    parser.add_argument("--maxiter", type=int, default=100)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per run")
+    parser.add_argument("--convergence", action="store_true", help="main.py --convergence: stop tests on (iteration counts may differ)")
+    parser.add_argument("--out", default="scaling", help="directory for the runs and the table")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    rows = []
+    for hmax in args.hmax:
+        for mode in args.modes:
+            results_dir = os.path.abspath(os.path.join(args.out, f"{args.geometry}_h{hmax}_{mode}"))
+            rows.append(run(args.geometry, hmax, mode, args.maxiter, results_dir, args.timeout, args.convergence))
+            print({k: rows[-1].get(k) for k in ('hmax', 'mode', 'cells', 'loop', 'setup', 'iterations', 'fine_solves', 'comp', 'failed')})
+    lines = table(rows)
+    print(f"{'hmax':>7s} {'cells':>9s} {'surr. s':>9s} {'base s':>9s} {'speedup':>7s} {'fine s/b':>9s} {'comp s/b':>8s} {'rss MB s/b':>13s}")
+    for r in lines:   ## seconds of the optimization loop, setup excluded
+        print(f"{r['hmax']:7.3f} {r['cells']:9d} {r['surrogate_loop']:9.1f} {r['baseline_loop']:9.1f} {r['speedup']:7.2f} "
+              f"{r['surrogate_fine']:4d}/{r['baseline_fine']:<4d} {r['comp_ratio']:8.3f} "
+              f"{r['surrogate_rss_mb']:6.0f}/{r['baseline_rss_mb']:<6.0f}")
+    even = [r for r in lines if r['speedup'] >= 1]
+    print("break-even :", f"from {min(r['cells'] for r in even)} cells" if even else "not reached in this sweep")
+    with open(os.path.join(args.out, "scaling.json"), "w") as f:
+        json.dump({'runs': rows, 'table': lines}, f, indent=1)
+    if lines:
+        with open(os.path.join(args.out, "scaling.csv"), "w", newline="") as f:
+            out = csv.DictWriter(f, fieldnames=list(lines[0]))
+            out.writeheader()
+            out.writerows(lines)
+
+
+if __name__ == "__main__":
+    main()
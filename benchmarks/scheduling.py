@@ -0,0 +1,70 @@
+## fixed vs adaptive fine-solve scheduling (FineScheduler) against the pure-FE baseline:
+##   python -m benchmarks.scheduling --cases hook3d:0.09 mbb2d:0.02 --maxiter 100 --out scheduling
+## Every run does exactly maxiter iterations; the fine-solve cost of a run is the "fine" phase (FE solve, adjoint,
+## fine features), the loop time is total - setup as in benchmarks.scaling.
+import argparse
+import csv
+import json
+import os
+
+from benchmarks.scaling import run
+
+VARIANTS = {
+    'baseline': ("baseline", None),
+    'fixed': ("surrogate", None),   ## loop < Ni+Wi or every Nf iterations
+    'adaptive': ("surrogate", {'schedule': {'adaptive': True}}),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", nargs="+", default=["hook3d:0.09", "mbb2d:0.02"], help="geometry:hmax")
+    parser.add_argument("--maxiter", type=int, default=100)
+    parser.add_argument("--mc-samples", type=int, default=0, help="MC-dropout samples for the variance signal")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per run")
+    parser.add_argument("--out", default="scheduling", help="directory for the runs and the table")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    rows, lines = [], []
+    for case in args.cases:
+        geometry, hmax = case.split(":")
+        by = {}
+        for name, (mode, overrides) in VARIANTS.items():
+            if name == 'adaptive' and args.mc_samples:
+                overrides = {**overrides, 'mc_samples': args.mc_samples}
+            results_dir = os.path.abspath(os.path.join(args.out, f"{geometry}_h{hmax}_{name}"))
+            r = run(geometry, float(hmax), mode, args.maxiter, results_dir, args.timeout, overrides=overrides)
+            r['variant'] = name
+            rows.append(r)
+            if 'failed' in r:
+                print(f"{geometry} {name}: failed ({r['failed']})")
+                continue
+            r['fine_time'] = r['phases'].get('fine', 0.0)
+            by[name] = r
+        if len(by) < len(VARIANTS):
+            continue
+        b, f, a = by['baseline'], by['fixed'], by['adaptive']
+        lines.append(dict(geometry=geometry, hmax=float(hmax), cells=b['cells'],
+                          baseline_fine=b['fine_solves'], fixed_fine=f['fine_solves'], adaptive_fine=a['fine_solves'],
+                          baseline_fine_time=b['fine_time'], fixed_fine_time=f['fine_time'], adaptive_fine_time=a['fine_time'],
+                          fixed_loop=f['loop'], adaptive_loop=a['loop'],
+                          fine_saved=f['fine_solves'] - a['fine_solves'], speedup=f['loop']/a['loop'],
+                          fixed_comp_ratio=f['comp']/b['comp'], adaptive_comp_ratio=a['comp']/b['comp']))
+
+    print(f"{'geometry':>9s} {'cells':>9s} {'fine b/f/a':>14s} {'fine s f/a':>13s} {'loop s f/a':>13s} {'speedup':>7s} {'comp f/a vs b':>14s}")
+    for r in lines:
+        print(f"{r['geometry']:>9s} {r['cells']:9d} {r['baseline_fine']:4d}/{r['fixed_fine']:4d}/{r['adaptive_fine']:<4d} "
+              f"{r['fixed_fine_time']:6.0f}/{r['adaptive_fine_time']:<6.0f} {r['fixed_loop']:6.0f}/{r['adaptive_loop']:<6.0f} "
+              f"{r['speedup']:7.2f} {r['fixed_comp_ratio']:6.3f}/{r['adaptive_comp_ratio']:<6.3f}")
+    with open(os.path.join(args.out, "scheduling.json"), "w") as f:
+        json.dump({'runs': rows, 'table': lines}, f, indent=1)
+    if lines:
+        with open(os.path.join(args.out, "scheduling.csv"), "w", newline="") as f:
+            out = csv.DictWriter(f, fieldnames=list(lines[0]))
+            out.writeheader()
+            out.writerows(lines)
+
+
+if __name__ == "__main__":
+    main()
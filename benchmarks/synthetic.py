@@ -0,0 +1,54 @@
+## Synthetic patch graphs for benchmarks that should run without gmsh.
+import numpy as np
+import torch
+from scipy.ndimage import uniform_filter
+from torch_geometric.data import Data
+
+from model import coarse_patches, generate_dataset, partition_graph
+from utils import PatchIndex
+
+
+def grid_edges(idx):
+    pairs = np.concatenate([
+        np.c_[idx[:, :-1].ravel(), idx[:, 1:].ravel()],
+        np.c_[idx[:-1, :].ravel(), idx[1:, :].ravel()]])
+    return np.concatenate([pairs, pairs[:, ::-1]]).T
+
+
+def grid_patches(n_cells, patch_size=200, n_features=4, seed=0, coarsen=None):
+    ## square grid of cells with 4-neighbour adjacency, split into square patches;
+    ## with `coarsen`, blocks of coarsen x coarsen cells form the coarse level of HierGNN.
+    ## The target depends on the inputs over a quarter of the domain (a box average, like a load path),
+    ## so a model that only sees its patch cannot fit it.
+    rng = np.random.default_rng(seed)
+    side = int(round(np.sqrt(n_cells)))
+    idx = np.arange(side*side).reshape(side, side)
+    edge_index = grid_edges(idx)
+    center = np.c_[np.divmod(np.arange(side*side), side)].astype(float)/side
+    global_graph = Data(
+        x=torch.tensor(center),
+        edge_index=torch.tensor(edge_index, dtype=torch.long)
+    )
+    b = max(int(round(np.sqrt(patch_size))), 1)
+    part_elems = [idx[i:i+b, j:j+b].ravel() for i in range(0, side, b) for j in range(0, side, b)]
+    partitioned_graphs = [partition_graph(subset, global_graph) for subset in part_elems]
+    if coarsen:
+        sideC = -(-side//coarsen)
+        idxC = np.arange(sideC*sideC).reshape(sideC, sideC)
+        assign = idxC[np.arange(side)[:, None]//coarsen, np.arange(side)[None, :]//coarsen].ravel()
+        coarse = coarse_patches(assign, grid_edges(idxC), sideC*sideC, part_elems)
+        for graph, (pool, coarse_edge_index, num_coarse, coarse_nodes) in zip(partitioned_graphs, coarse):
+            graph.pool = pool
+            graph.coarse_edge_index = coarse_edge_index
+            graph.num_coarse = num_coarse
+            graph.coarse_nodes = coarse_nodes
+    x = rng.uniform(-1, 1, (side*side, n_features))
+    x[:, 0] = rng.uniform(0, 1, side*side)
+    e = (x[:, 0]**3*(1 + x[:, 1]**2)).reshape(side, side)   ## SIMP-like energy density
+    y = -(uniform_filter(e, size=max(side//4, 1), mode='nearest') + 0.2*e).reshape(-1, 1)
+    return x, y, part_elems, partitioned_graphs, center
+
+
+def patch_dataset(n_cells, patch_size=200, n_features=4, seed=0, coarsen=None):
+    x, y, part_elems, partitioned_graphs, _ = grid_patches(n_cells, patch_size, n_features, seed, coarsen)
+    return generate_dataset(x, y, partitioned_graphs, PatchIndex(part_elems))
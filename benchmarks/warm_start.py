@@ -0,0 +1,60 @@
+## synchronous vs background training vs warm start on the same problem:
+##   python -m benchmarks.warm_start --geometry hook3d --hmax 0.09 [--source-hmax 0.12] --maxiter 100 --out warm_start
+## sync: retraining blocks the loop; background: async_training, the loop keeps predicting with the old network;
+## warm: init_model from the sync run at --source-hmax (default: the same hmax), Ni_ft/Wi_ft warm-up.
+## All runs do exactly maxiter iterations, times are the loop time (total - setup) as in benchmarks.scaling.
+import argparse
+import json
+import os
+
+from benchmarks.scaling import run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--geometry", default="hook3d")
+    parser.add_argument("--hmax", type=float, default=0.09)
+    parser.add_argument("--source-hmax", type=float, default=None, help="mesh of the warm-start model (default: --hmax)")
+    parser.add_argument("--maxiter", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per run")
+    parser.add_argument("--out", default="warm_start", help="directory for the runs and the table")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    out = lambda name: os.path.abspath(os.path.join(args.out, f"{args.geometry}_{name}"))
+    source_hmax = args.source_hmax or args.hmax
+    rows = {}
+    rows['sync'] = run(args.geometry, args.hmax, "sync", args.maxiter, out("sync"), args.timeout)
+    rows['background'] = run(args.geometry, args.hmax, "background", args.maxiter, out("background"), args.timeout,
+                             overrides={'async_training': True})
+    source = out("sync")
+    if source_hmax != args.hmax:
+        source = out(f"source_h{source_hmax}")
+        rows['source'] = run(args.geometry, source_hmax, "source", args.maxiter, source, args.timeout)
+    rows['warm'] = run(args.geometry, args.hmax, "warm", args.maxiter, out("warm"), args.timeout,
+                       overrides={'init_model': os.path.join(source, "model.pt")})
+
+    print(f"{'run':>10s} {'loop s':>9s} {'train s':>9s} {'blocked s':>9s} {'fine':>5s} {'comp':>10s}")
+    for name, r in rows.items():
+        if 'failed' in r:
+            print(f"{name:>10s} failed ({r['failed']})")
+            continue
+        r['train'] = r['phases'].get('train', 0.0)   ## training compute, on whichever thread it ran
+        r['blocked'] = r['phases'].get('training', 0.0)   ## loop time spent in the training phase
+        print(f"{name:>10s} {r['loop']:9.1f} {r['train']:9.1f} {r['blocked']:9.1f} {r['fine_solves']:5d} {r['comp']:10.4e}")
+    ok = lambda *names: all(n in rows and 'failed' not in rows[n] for n in names)
+    summary = {}
+    if ok('sync', 'background'):
+        summary['background_speedup'] = rows['sync']['loop']/rows['background']['loop']
+        summary['background_comp_ratio'] = rows['background']['comp']/rows['sync']['comp']
+    if ok('sync', 'warm'):
+        summary['warm_speedup'] = rows['sync']['loop']/rows['warm']['loop']
+        summary['warm_fine_saved'] = rows['sync']['fine_solves'] - rows['warm']['fine_solves']
+        summary['warm_comp_ratio'] = rows['warm']['comp']/rows['sync']['comp']
+    print(summary)
+    with open(os.path.join(args.out, "warm_start.json"), "w") as f:
+        json.dump({'runs': rows, 'summary': summary}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
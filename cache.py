@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+
+class ArtifactCache:
+    """Directory of preprocessing bundles, one subdirectory per key.
+
+    A bundle holds dense arrays as ``.npy`` and CSR matrices as their
+    data/indices/indptr ``.npy`` files, listed in ``manifest.json``. Loading
+    memory-maps every file (``mmap_mode='r'``), so a hit costs no parsing and
+    pages are only read when touched. Bundles are written to a temporary
+    directory and renamed into place, so concurrent runs never see a partial
+    bundle.
+    """
+
+    VERSION = 2   ## bump when the stored artifacts change meaning (2: coarse halo of the patch graphs)
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @classmethod
+    def key(cls, *arrays, **params):
+        ## hash of the raw array bytes (with dtype and shape) and the parameters
+        h = hashlib.sha256(f"v{cls.VERSION}".encode())
+        for arr in arrays:
+            arr = np.ascontiguousarray(arr)
+            h.update(f"{arr.dtype.str}{arr.shape}".encode())
+            h.update(arr.data)
+        h.update(json.dumps(params, sort_keys=True).encode())
+        return h.hexdigest()[:32]
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def load(self, key):
+        path = self.path(key)
+        if not os.path.exists(os.path.join(path, "manifest.json")):
+            return None
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+        npy = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+        out = {}
+        for name, entry in manifest.items():
+            if entry["kind"] == "csr":
+                out[name] = csr_matrix((npy(name + ".data"), npy(name + ".indices"), npy(name + ".indptr")),
+                                       shape=tuple(entry["shape"]), copy=False)
+            else:
+                out[name] = npy(name)
+        return out
+
+    def save(self, key, artifacts):
+        if os.path.exists(self.path(key)):
+            return
+        tmp = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        manifest = {}
+        for name, value in artifacts.items():
+            if issparse(value):
+                value = value.tocsr()
+                for part in ("data", "indices", "indptr"):
+                    np.save(os.path.join(tmp, f"{name}.{part}.npy"), getattr(value, part))
+                manifest[name] = {"kind": "csr", "shape": list(value.shape)}
+            else:
+                np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(value))
+                manifest[name] = {"kind": "array"}
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        try:
+            os.rename(tmp, self.path(key))
+        except OSError:   ## another run stored the same bundle first
+            shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,105 @@
+import copy
+import os
+import random
+import signal
+import threading
+
+import numpy as np
+import torch
+
+
+def rng_state():
+    state = {'random': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['random'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def write_atomic(path, state):
+    ## write next to the target, fsync, then rename over it: readers see the old or the new file, never a partial one
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        torch.save(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)   ## persist the rename itself
+    finally:
+        os.close(fd)
+
+
+def load_checkpoint(path, device=None):
+    if not os.path.exists(path):
+        return None
+    return torch.load(path, map_location=device, weights_only=False)
+
+
+def on_preemption(signals=(signal.SIGTERM,)):
+    ## event set when the batch system asks the job to stop; the loop then checkpoints and returns
+    event = threading.Event()
+    for sig in signals:
+        signal.signal(sig, lambda *_: event.set())
+    return event
+
+
+class CheckpointWriter:
+    """Writes checkpoints of the optimizer state atomically on a background thread.
+
+    ``save`` deep-copies the state on the calling thread and hands it to the
+    writer, which serializes it with ``torch.save`` into a single file via
+    ``write_atomic``. If the writer is still busy, the pending state is
+    replaced by the newer one, so the loop never waits on the disk. The
+    ``before`` calls (e.g. ``SnapshotStore.pending``) run on the writer thread
+    ahead of the state, for data the checkpoint refers to but does not hold.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.error = None
+        self.written = []   ## loop of every checkpoint on disk
+        self._pending = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def save(self, state, before=()):
+        state = copy.deepcopy(state)
+        with self._cond:
+            self._pending = (state, list(before))   ## a replaced save is covered by the newer one (append-only data)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                (state, before), self._pending = self._pending, None
+            try:
+                for call in before:
+                    call()
+                write_atomic(self.path, state)
+                self.written.append(state.get('loop'))
+            except Exception as e:   ## keep the loop alive, report at close
+                self.error = e
+
+    def close(self):
+        ## write the pending checkpoint, if any, and stop the writer
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        if self.error is not None:
+            print("checkpoint failed :", self.error)
@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class FineScheduler:
+    """Decides on which iterations the fine FE solve + adjoint is run.
+
+    With ``adaptive=False`` this is the fixed rule of the original driver: every
+    iteration of the warm-up (``Ni + Wi``) and then every ``Nf``-th iteration.
+    With ``adaptive=True`` a first model is trained after ``Ni`` iterations and
+    verified on the remaining warm-up iterations, which end early once its
+    angle error is below ``theta_tol``. After warm-up a fine solve is only
+    triggered when one of the cheap surrogate-quality signals exceeds its tolerance:
+
+        theta  : angle error (deg) of the surrogate at the last verification
+        drift  : relative change of the coarse-strain features since the last fine solve
+        var    : mean MC-dropout std of the last prediction (scaled units)
+        trend  : predicted relative compliance change since the last fine solve
+    """
+
+    def __init__(self, Ni, Wi, Nf, adaptive=False, theta_tol=10.0, drift_tol=0.1,
+                 var_tol=0.05, trend_tol=0.05, max_gap=None):
+        self.Ni = Ni
+        self.warmup = Ni + Wi
+        self.Nf = Nf
+        self.adaptive = adaptive
+        self.theta_tol = theta_tol
+        self.drift_tol = drift_tol
+        self.var_tol = var_tol
+        self.trend_tol = trend_tol
+        self.max_gap = 4*Nf if max_gap is None else max_gap
+        self.last_fine = -1
+        self.x_fine = None
+        self.comp_fine = None
+        self.theta = None
+        self.var = 0.0
+        self.dcomp = 0.0
+        self.reason = []
+
+    def fine_due(self, loop, x=None, net_ready=True):
+        if loop < self.warmup or not net_ready:
+            return True
+        if not self.adaptive:
+            return divmod(max(loop-self.warmup, 1), self.Nf)[1] == 0
+        signals = self.signals(x)
+        for name, value in signals.items():
+            if value > getattr(self, f"{name}_tol"):
+                self.reason.append((loop, name, value))
+                return True
+        if loop - self.last_fine >= self.max_gap:
+            self.reason.append((loop, "gap", loop - self.last_fine))
+            return True
+        return False
+
+    def signals(self, x=None):
+        signals = {}
+        if self.theta is not None:
+            signals['theta'] = self.theta
+        if x is not None and self.x_fine is not None:
+            e_old = self.x_fine[:, 1:]
+            signals['drift'] = np.linalg.norm(x[:, 1:] - e_old)/max(np.linalg.norm(e_old), 1e-12)
+        signals['var'] = self.var
+        if self.comp_fine:
+            signals['trend'] = abs(self.dcomp)/abs(self.comp_fine)
+        return signals
+
+    def early_model(self, loop):
+        ## adaptive: train after Ni iterations, so the verification has a model to end the warm-up with
+        return self.adaptive and loop == self.Ni - 1 < self.warmup - 1
+
+    def end_warmup(self, loop):
+        ## the model is already good -> make this iteration the last of the warm-up
+        self.warmup = min(self.warmup, loop + 1)
+
+    def record_fine(self, loop, x, comp):
+        self.last_fine = loop
+        self.x_fine = x.copy()
+        self.comp_fine = comp
+        self.var = 0.0
+        self.dcomp = 0.0
+
+    def record_theta(self, theta):
+        self.theta = theta
+
+    def record_surrogate(self, var, dcomp):
+        self.var = var
+        self.dcomp += dcomp
+
+
+class Termination:
+    """Stopping test of the optimization loop; any enabled criterion stops the run.
+
+        kkt    : norm of the KKT residual (MMA.kktcheck) of the last MMA/GCMMA step, MMA only
+        change : max |phi_new - phi_old| of the last step
+        comp   : relative spread of the fine compliance over the last ``window`` fine iterations
+
+    A tolerance of None disables the criterion. The test is only evaluated on
+    fine iterations, where compliance and gradient are verified (in the
+    surrogate phase the last fine compliance is the reference), and not
+    before ``min_iter``.
+    """
+
+    def __init__(self, kkt_tol=None, change_tol=None, comp_tol=None, window=5, min_iter=0):
+        self.kkt_tol = kkt_tol
+        self.change_tol = change_tol
+        self.comp_tol = comp_tol
+        self.window = window
+        self.min_iter = min_iter
+        self.comp = []
+        self.reason = None
+
+    def update(self, loop, fine, change=None, comp=None, kkt=None):
+        if not fine:
+            return False
+        if comp is not None:
+            self.comp.append(comp)
+        if loop < self.min_iter:
+            return False
+        signals = {'kkt': kkt, 'change': change}
+        if len(self.comp) >= self.window:
+            recent = self.comp[-self.window:]
+            signals['comp'] = (max(recent) - min(recent))/max(abs(recent[-1]), 1e-12)
+        for name, value in signals.items():
+            tol = getattr(self, f"{name}_tol")
+            if tol is not None and value is not None and value < tol:
+                self.reason = (loop, name, value)
+                return True
+        return False
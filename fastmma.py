@@ -0,0 +1,413 @@
+"""
+Flat-array MMA (Svanberg) for problems with few constraints and many variables.
+
+Same algorithm and iterates as MMA.mmasub/subsolv, restructured for m << n:
+the n-sized quantities are 1-D arrays living in preallocated work buffers
+and updated with in-place ufuncs, P and Q are dense (m, n) blocks scaled in
+place, and every Newton step reduces to the (m+1)x(m+1) dual system.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class MMA:
+    """One MMA solver per problem size; buffers are allocated on first use and reused.
+
+    With ``dtype=np.float32`` the n-sized arrays (design, bounds, asymptotes,
+    P, Q and the Newton work arrays) are single precision, which halves their
+    memory traffic; the m-sized dual quantities stay in float64 and all
+    reductions over n (matrix-vector products, Gram matrix, norms) accumulate
+    in float64 (``_dot``, ``_gram``, ``_sumsq``).
+
+    With ``threads > 1`` the elementwise work of the Newton iterations
+    (residuals, plam/qlam, gvec, the reduced system and the line search) runs
+    on a thread pool over chunks of ``chunk`` variables; the reductions are
+    combined from per-chunk partial sums, norms and extrema.
+    """
+
+    epsimin = 1e-7
+    raa0 = 1e-5
+    albefa = 0.1
+    asyinit = 0.5
+    asyincr = 1.2
+    asydecr = 0.7
+
+    def __init__(self, n, m=1, dtype=np.float64, threads=1, chunk=1 << 18):
+        self.n = n
+        self.m = m
+        self.dtype = np.dtype(dtype)
+        self._bufs = {}
+        ## the Newton work is evaluated per chunk of the design vector, in parallel when threads > 1
+        self.blocks = [slice(i, min(i+chunk, n)) for i in range(0, n, chunk)] if threads > 1 else [slice(0, n)]
+        self.pool = ThreadPoolExecutor(threads) if threads > 1 else None
+
+    def buf(self, name, rows=None):
+        ## named work array, allocated once
+        arr = self._bufs.get(name)
+        if arr is None:
+            shape = self.n if rows is None else (rows, self.n)
+            arr = self._bufs.setdefault(name, np.empty(shape, self.dtype))   ## atomic if two chunks race
+        return arr
+
+    def flat(self, v, name):
+        ## copy an (n,1)/(n,) input into a buffer of the solver dtype
+        out = self.buf(name)
+        out[:] = np.ravel(v)
+        return out
+
+    def sub(self, iter, xval, xmin, xmax, xold1, xold2, f0val, df0dx, fval, dfdx, low, upp, a0, a, c, d, move):
+        """One MMA iteration, same arguments and meaning as MMA.mmasub.
+
+        Returns flat arrays (xmma, ymma, zmma, lam, xsi, eta, mu, zet, s, low, upp);
+        the n-sized ones are copies, so they stay valid across calls.
+        """
+        m = self.m
+        xval = self.flat(xval, 'xval')
+        xmin = self.flat(xmin, 'xmin')
+        xmax = self.flat(xmax, 'xmax')
+        self.a0 = float(a0)
+        self.a = np.ravel(a).astype(np.float64)
+        self.c = np.ravel(c).astype(np.float64)
+        self.d = np.ravel(d).astype(np.float64)
+
+        ## asymptotes low and upp
+        xmami = np.subtract(xmax, xmin, out=self.buf('xmami'))
+        lo, up = self.buf('low'), self.buf('upp')
+        if iter <= 2:
+            np.multiply(xmami, -self.asyinit, out=lo)
+            lo += xval
+            np.multiply(xmami, self.asyinit, out=up)
+            up += xval
+        else:
+            xold1 = self.flat(xold1, 'xold1')
+            xold2 = self.flat(xold2, 'xold2')
+            zzz = np.subtract(xval, xold1, out=self.buf('t0'))
+            zzz *= np.subtract(xold1, xold2, out=self.buf('t1'))
+            factor = self.buf('t1')
+            factor.fill(1.0)
+            factor[zzz > 0] = self.asyincr
+            factor[zzz < 0] = self.asydecr
+            np.subtract(xold1, np.ravel(low), out=lo)
+            lo *= factor
+            np.subtract(xval, lo, out=lo)
+            np.subtract(np.ravel(upp), xold1, out=up)
+            up *= factor
+            up += xval
+            bound = self.buf('t0')
+            np.maximum(lo, np.subtract(xval, np.multiply(xmami, 10, out=bound), out=bound), out=lo)
+            np.minimum(lo, np.subtract(xval, np.multiply(xmami, 0.01, out=bound), out=bound), out=lo)
+            np.minimum(up, np.add(xval, np.multiply(xmami, 10, out=bound), out=bound), out=up)
+            np.maximum(up, np.add(xval, np.multiply(xmami, 0.01, out=bound), out=bound), out=up)
+        self.low, self.upp = lo, up
+
+        ## move limits alfa and beta
+        alfa, beta, t = self.buf('alfa'), self.buf('beta'), self.buf('t0')
+        np.subtract(xval, lo, out=alfa)
+        alfa *= self.albefa
+        alfa += lo
+        np.maximum(alfa, np.subtract(xval, np.multiply(xmami, move, out=t), out=t), out=alfa)
+        np.maximum(alfa, xmin, out=alfa)
+        np.subtract(up, xval, out=beta)
+        beta *= -self.albefa
+        beta += up
+        np.minimum(beta, np.add(xval, np.multiply(xmami, move, out=t), out=t), out=beta)
+        np.minimum(beta, xmax, out=beta)
+        self.alfa, self.beta = alfa, beta
+
+        ## p0, q0, P, Q and b
+        raa = np.maximum(xmami, 0.00001, out=self.buf('raa'))
+        np.reciprocal(raa, out=raa)
+        raa *= self.raa0
+        ux2 = np.subtract(up, xval, out=self.buf('ux2'))
+        ux2 *= ux2
+        xl2 = np.subtract(xval, lo, out=self.buf('xl2'))
+        xl2 *= xl2
+        df0dx = np.ravel(df0dx)
+        self.p0 = self._split(df0dx, raa, ux2, self.buf('p0'), 1.0)
+        self.q0 = self._split(df0dx, raa, xl2, self.buf('q0'), -1.0)
+        dfdx = np.reshape(dfdx, (m, self.n))
+        self.P = self.buf('P', m)
+        self.Q = self.buf('Q', m)
+        for i in range(m):
+            self._split(dfdx[i], raa, ux2, self.P[i], 1.0)
+            self._split(dfdx[i], raa, xl2, self.Q[i], -1.0)
+        uxinv = np.subtract(up, xval, out=self.buf('t0'))
+        np.reciprocal(uxinv, out=uxinv)
+        xlinv = np.subtract(xval, lo, out=self.buf('t1'))
+        np.reciprocal(xlinv, out=xlinv)
+        self.b = _dot(self.P, uxinv) + _dot(self.Q, xlinv) - np.ravel(fval)
+
+        self.subsolv()
+        return (self.x.copy(), self.y.copy(), self.z, self.lam.copy(), self.xsi.copy(), self.eta.copy(),
+                self.mu.copy(), self.zet, self.s.copy(), lo.copy(), up.copy())
+
+    def _split(self, g, raa, scale, out, sign):
+        ## (max(sign*g, 0) + 0.001*|g| + raa0/xmami) * scale, i.e. p (sign=1) or q (sign=-1) of MMA.mmasub
+        t = self.buf('t2')
+        np.multiply(g, sign, out=out)
+        np.maximum(out, 0, out=out)
+        np.abs(g, out=t)
+        t *= 0.001
+        t += raa
+        out += t
+        out *= scale
+        return out
+
+    def subsolv(self):
+        """Primal-dual Newton method for the MMA subproblem (see MMA.subsolv)."""
+        m = self.m
+        een = np.ones(m)
+        self.x = np.add(self.alfa, self.beta, out=self.buf('x'))
+        self.x *= 0.5
+        self.xsi = np.subtract(self.x, self.alfa, out=self.buf('xsi'))
+        np.reciprocal(self.xsi, out=self.xsi)
+        np.maximum(self.xsi, 1.0, out=self.xsi)
+        self.eta = np.subtract(self.beta, self.x, out=self.buf('eta'))
+        np.reciprocal(self.eta, out=self.eta)
+        np.maximum(self.eta, 1.0, out=self.eta)
+        self.y = een.copy()
+        self.z = 1.0
+        self.lam = een.copy()
+        self.mu = np.maximum(een, 0.5*self.c)
+        self.zet = 1.0
+        self.s = een.copy()
+        epsi = 1.0
+        while epsi > self.epsimin:
+            residunorm, residumax = self.residual(epsi)
+            ittt = 0
+            while residumax > 0.9*epsi and ittt < 200:
+                ittt += 1
+                steg, step = self.newton(epsi)
+                old = self.save()
+                itto = 0
+                resinew = 2*residunorm
+                while resinew > residunorm and itto < 50:
+                    itto += 1
+                    self.advance(old, step, steg)
+                    resinew, residumax = self.residual(epsi)
+                    steg = steg/2
+                residunorm = resinew
+            epsi = 0.1*epsi
+
+    def lamT(self, lam, p0, P, out):
+        ## p0 + P.T@lam
+        np.multiply(P[0], self.dtype.type(lam[0]), out=out)
+        for i in range(1, self.m):
+            out += P[i]*self.dtype.type(lam[i])
+        out += p0
+        return out
+
+    def map(self, fn, *args):
+        ## fn(block, *args) on every chunk of the design vector; the ufuncs release the GIL
+        if self.pool is None:
+            return [fn(sl, *args) for sl in self.blocks]
+        return list(self.pool.map(lambda sl: fn(sl, *args), self.blocks))
+
+    def view(self, sl, *names):
+        return [self.buf(name)[sl] for name in names]
+
+    def _residual_block(self, sl, epsi):
+        ## partial squared norm, max-abs and gvec of the n-sized residual parts of one chunk
+        x, xsi, eta, alfa, beta, low, upp = self.view(sl, 'x', 'xsi', 'eta', 'alfa', 'beta', 'low', 'upp')
+        uxinv1, xlinv1, plam, qlam, r, t = self.view(sl, 'r_ux', 'r_xl', 'r_plam', 'r_qlam', 'r0', 'r1')
+        P, Q = self.P[:, sl], self.Q[:, sl]
+        np.subtract(upp, x, out=uxinv1)
+        np.reciprocal(uxinv1, out=uxinv1)
+        np.subtract(x, low, out=xlinv1)
+        np.reciprocal(xlinv1, out=xlinv1)
+        self.lamT(self.lam, self.buf('p0')[sl], P, plam)
+        self.lamT(self.lam, self.buf('q0')[sl], Q, qlam)
+        gvec = _dot(P, uxinv1) + _dot(Q, xlinv1)
+        np.multiply(plam, uxinv1, out=r)   ## rex = dpsi/dx - xsi + eta
+        r *= uxinv1
+        np.multiply(qlam, xlinv1, out=t)
+        t *= xlinv1
+        r -= t
+        r -= xsi
+        r += eta
+        norm2, rmax = _sumsq(r), _absmax(r)
+        np.subtract(x, alfa, out=r)   ## rexsi
+        r *= xsi
+        r -= epsi
+        norm2, rmax = norm2 + _sumsq(r), max(rmax, _absmax(r))
+        np.subtract(beta, x, out=r)   ## reeta
+        r *= eta
+        r -= epsi
+        norm2, rmax = norm2 + _sumsq(r), max(rmax, _absmax(r))
+        return norm2, rmax, gvec
+
+    def residual(self, epsi):
+        ## norm and max-abs of the perturbed KKT residual at the current point, from per-chunk partials
+        parts = self.map(self._residual_block, epsi)
+        norm2 = sum(p[0] for p in parts)
+        rmax = max(p[1] for p in parts)
+        gvec = sum(p[2] for p in parts)
+        y, z, lam, mu, zet, s = self.y, self.z, self.lam, self.mu, self.zet, self.s
+        small = np.concatenate((
+            self.c + self.d*y - mu - lam,   ## rey
+            [self.a0 - zet - np.dot(self.a, lam)],   ## rez
+            gvec - self.a*z - y + s - self.b,   ## relam
+            mu*y - epsi,   ## remu
+            [zet*z - epsi],   ## rezet
+            lam*s - epsi))   ## res
+        norm2 += np.dot(small, small)
+        rmax = max(rmax, np.abs(small).max())
+        return np.sqrt(norm2), rmax
+
+    def _system_block(self, sl, epsi):
+        ## delx and 1/diagx of one chunk plus its contributions to gvec, GG@(delx/diagx) and GG/diagx@GG.T
+        m = self.m
+        x, xsi, eta, alfa, beta, low, upp = self.view(sl, 'x', 'xsi', 'eta', 'alfa', 'beta', 'low', 'upp')
+        uxinv1, xlinv1, uxinv2, xlinv2, xainv, bxinv, plam, qlam, delx, diagxinv, t = self.view(
+            sl, 'n_ux1', 'n_xl1', 'n_ux2', 'n_xl2', 'n_xa', 'n_bx', 'n_plam', 'n_qlam', 'n_delx', 'n_diagx', 'n_t')
+        P, Q, GG, GGd = self.P[:, sl], self.Q[:, sl], self.buf('GG', m)[:, sl], self.buf('GGd', m)[:, sl]
+        np.subtract(upp, x, out=uxinv1)
+        np.reciprocal(uxinv1, out=uxinv1)
+        np.subtract(x, low, out=xlinv1)
+        np.reciprocal(xlinv1, out=xlinv1)
+        np.multiply(uxinv1, uxinv1, out=uxinv2)
+        np.multiply(xlinv1, xlinv1, out=xlinv2)
+        np.subtract(x, alfa, out=xainv)
+        np.reciprocal(xainv, out=xainv)
+        np.subtract(beta, x, out=bxinv)
+        np.reciprocal(bxinv, out=bxinv)
+        self.lamT(self.lam, self.buf('p0')[sl], P, plam)
+        self.lamT(self.lam, self.buf('q0')[sl], Q, qlam)
+        gvec = _dot(P, uxinv1) + _dot(Q, xlinv1)
+        for i in range(m):
+            np.multiply(P[i], uxinv2, out=GG[i])
+            GG[i] -= np.multiply(Q[i], xlinv2, out=t)
+
+        np.multiply(plam, uxinv2, out=delx)
+        delx -= np.multiply(qlam, xlinv2, out=t)
+        delx -= np.multiply(xainv, epsi, out=t)
+        delx += np.multiply(bxinv, epsi, out=t)
+        np.multiply(plam, uxinv2, out=diagxinv)
+        diagxinv *= uxinv1
+        np.multiply(qlam, xlinv2, out=t)
+        t *= xlinv1
+        diagxinv += t
+        diagxinv *= 2
+        diagxinv += np.multiply(xsi, xainv, out=t)
+        diagxinv += np.multiply(eta, bxinv, out=t)
+        np.reciprocal(diagxinv, out=diagxinv)
+        w = np.multiply(delx, diagxinv, out=t)
+        np.multiply(GG, diagxinv, out=GGd)
+        return gvec, _dot(GG, w), _gram(GGd, GG)
+
+    def _direction_block(self, sl, dlam, epsi):
+        ## dx, dxsi, deta of one chunk and its bounds on the step length
+        xsi, eta, xainv, bxinv, delx, diagxinv, t = self.view(sl, 'xsi', 'eta', 'n_xa', 'n_bx', 'n_delx', 'n_diagx', 'n_t')
+        dx, dxsi, deta = self.view(sl, 'dx', 'dxsi', 'deta')
+        self.lamT(dlam, delx, self.buf('GG', self.m)[:, sl], dx)   ## dx = -(delx + GG.T@dlam)/diagx
+        dx *= diagxinv
+        np.negative(dx, out=dx)
+        np.multiply(xsi, dx, out=dxsi)   ## -xsi + (epsi - xsi*dx)/(x-alfa)
+        np.subtract(epsi, dxsi, out=dxsi)
+        dxsi *= xainv
+        dxsi -= xsi
+        np.multiply(eta, dx, out=deta)   ## -eta + (epsi + eta*dx)/(beta-x)
+        deta += epsi
+        deta *= bxinv
+        deta -= eta
+        return (float(np.min(np.divide(dxsi, xsi, out=t))), float(np.min(np.divide(deta, eta, out=t))),
+                float(np.min(np.multiply(dx, xainv, out=t))), float(np.max(np.multiply(dx, bxinv, out=t))))
+
+    def newton(self, epsi):
+        ## Newton direction, reduced to the (m+1)x(m+1) system in (dlam, dz); returns (step length, direction)
+        m = self.m
+        y, z, lam, mu, zet, s = self.y, self.z, self.lam, self.mu, self.zet, self.s
+        a, c, d = self.a, self.c, self.d
+        parts = self.map(self._system_block, epsi)
+        gvec, GGw, GGG = [sum(p[i] for p in parts) for i in range(3)]
+
+        dely = c + d*y - lam - epsi/y
+        delz = self.a0 - np.dot(a, lam) - epsi/z
+        dellam = gvec - a*z - y - self.b + epsi/lam
+        diagy = d + mu/y
+        diaglamyi = s/lam + 1/diagy
+        blam = dellam + dely/diagy - GGw
+        AA = np.empty((m+1, m+1))
+        AA[:m, :m] = np.diag(diaglamyi) + GGG
+        AA[:m, m] = a
+        AA[m, :m] = a
+        AA[m, m] = -zet/z
+        solut = np.linalg.solve(AA, np.r_[blam, delz])
+        dlam, dz = solut[:m], solut[m]
+
+        parts = self.map(self._direction_block, dlam, epsi)
+        dy = -dely/diagy + dlam/diagy
+        dmu = -mu + epsi/y - (mu*dy)/y
+        dzet = -zet + epsi/z - zet*dz/z
+        ds = -s + epsi/lam - (s*dlam)/lam
+
+        small = np.concatenate((y, [z], lam, mu, [zet], s))
+        dsmall = np.concatenate((dy, [dz], dlam, dmu, [dzet], ds))
+        stmxx = max(np.max(-1.01*dsmall/small),
+                    -1.01*min(p[0] for p in parts),
+                    -1.01*min(p[1] for p in parts))
+        stmalfa = -1.01*min(p[2] for p in parts)
+        stmbeta = 1.01*max(p[3] for p in parts)
+        steg = 1.0/max(stmalfa, stmbeta, stmxx, 1.0)
+        return steg, (dy, dz, dlam, dmu, dzet, ds)
+
+    def _save_block(self, sl):
+        for name in ('x', 'xsi', 'eta'):
+            np.copyto(self.buf(name + 'old')[sl], self.buf(name)[sl])
+
+    def save(self):
+        ## current iterate, the origin of the line search
+        self.map(self._save_block)
+        return (self.y, self.z, self.lam, self.mu, self.zet, self.s)
+
+    def _advance_block(self, sl, steg):
+        for name, d in (('x', 'dx'), ('xsi', 'dxsi'), ('eta', 'deta')):
+            v = self.buf(name)[sl]
+            np.multiply(self.buf(d)[sl], self.dtype.type(steg), out=v)
+            v += self.buf(name + 'old')[sl]
+
+    def advance(self, old, step, steg):
+        ## iterate = old + steg*direction
+        self.map(self._advance_block, steg)
+        self.y, self.z, self.lam, self.mu, self.zet, self.s = \
+            [v + steg*dv for v, dv in zip(old, step)]
+
+
+def _dot(A, v):
+    ## A@v accumulated in float64; einsum casts float32 operands buffer-wise instead of copying them
+    if A.dtype == np.float64 and v.dtype == np.float64:
+        return A@v
+    return np.einsum('ij,j->i', A, v, dtype=np.float64)
+
+
+def _gram(A, B):
+    ## A@B.T in float64, (m, m)
+    if A.dtype == np.float64 and B.dtype == np.float64:
+        return A@B.T
+    return np.einsum('ij,kj->ik', A, B, dtype=np.float64)
+
+
+def _sumsq(v):
+    if v.dtype == np.float64:
+        return float(np.dot(v, v))
+    return float(np.einsum('i,i->', v, v, dtype=np.float64))
+
+
+def _absmax(v):
+    return float(max(v.max(), -v.min()))
+
+
+_solvers = {}
+
+
+def mmasub(m,n,iter,xval,xmin,xmax,xold1,xold2,f0val,df0dx,fval,dfdx,low,upp,a0,a,c,d,move,dtype=np.float64,threads=1):
+    """Drop-in replacement for MMA.mmasub (same arguments, column-vector outputs)."""
+    key = (n, m, np.dtype(dtype), threads)
+    if key not in _solvers:
+        _solvers[key] = MMA(n, m, dtype, threads)
+    xmma,ymma,zmma,lam,xsi,eta,mu,zet,s,low,upp = _solvers[key].sub(
+        iter,xval,xmin,xmax,xold1,xold2,f0val,df0dx,fval,dfdx,low,upp,a0,a,c,d,move)
+    col = lambda v: np.reshape(v, (-1, 1))
+    return col(xmma),col(ymma),np.array([[zmma]]),col(lam),col(xsi),col(eta),col(mu),np.array([[zet]]),col(s),col(low),col(upp)
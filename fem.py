@@ -7,7 +7,8 @@ from scipy.sparse.linalg import factorized
 from scipy.spatial import cKDTree
 from sklearn.preprocessing import MinMaxScaler
 
-from utils import filter, map_mesh
+from timing import timed
+from utils import field, filter, map_mesh
 
 # fe.parameters["linear_algebra_backend"] = "Eigen"
 
@@ -52,9 +53,14 @@ def build_weakform_filter(rho, drho, phih, rmin):
     return aH, LH
 
 
-def build_weakform_struct(u, du, rhoh, t, ds, penal, subdomain_id=2):
+def load_area(ds, subdomain_id=2):
+    return adj.assemble(adj.Constant(1.0)*ds(subdomain_id))
+
+
+def build_weakform_struct(u, du, rhoh, t, ds, penal, subdomain_id=2, loadArea=None):
     if u.ufl_shape[0]==3:
-        loadArea = adj.assemble(adj.Constant(1.0)*ds(2))
+        if loadArea is None:
+            loadArea = load_area(ds)
         scaledLoad = t / loadArea
     else:
         scaledLoad = t
@@ -69,7 +75,8 @@ def displacement(u):
     return fe.sqrt(u[0]**2 + u[1]**2)
 
 
-def input_assemble(rhoh, uhC, V, F, FC, v2dC, center, coordsC=None, T=None, scaler=None):
+@timed()
+def input_assemble(rhoh, uhC, V, F, FC, v2dC, center, coordsC=None, T=None, scaler=None, transfer=None):
     eC = epsilon(uhC)
     # uht = adj.interpolate(uhC,V)
     # eC = epsilon(uht)
@@ -77,14 +84,17 @@ def input_assemble(rhoh, uhC, V, F, FC, v2dC, center, coordsC=None, T=None, scal
 
     # for i in range(eC.ufl_shape[0]):
         # e_mapped[:,i]=adj.project(eC[i],F).vector()[:]
-    if center.shape[1] == 2:
+    if transfer is not None:   ## precomputed coarse node -> fine cell interpolation (ProblemSetup)
+        for i in range(eC.ufl_shape[0]):
+            e_mapped[:, i] = transfer @ field(adj.project(eC[i], FC))[v2dC]
+    elif center.shape[1] == 2:
         for i in range(3):
-            coarse_node2fine_cell = LinearTriInterpolator(T, adj.project(eC[i], FC).vector()[v2dC])
+            coarse_node2fine_cell = LinearTriInterpolator(T, field(adj.project(eC[i], FC))[v2dC])
             e_mapped[:, i] = coarse_node2fine_cell(*center.T).data
     else:
         tree = None
         for i in range(6):
-            data_from = adj.project(eC[i], FC).vector()[v2dC]
+            data_from = field(adj.project(eC[i], FC))[v2dC]
             interpolator = LinearNDInterpolator(coordsC, data_from)
             data = interpolator(center).data
             flag = np.isnan(data)
@@ -101,10 +111,11 @@ def input_assemble(rhoh, uhC, V, F, FC, v2dC, center, coordsC=None, T=None, scal
         scaler.fit(e_mapped)
 
     e_mapped = scaler.transform(e_mapped)
-    x = np.c_[rhoh.vector()[:], e_mapped]
+    x = np.c_[field(rhoh), e_mapped]
     return x, scaler
 
 
+@timed()
 def output_assemble(dc, loop, F, scalers = None,  lb = None, k = 5):
     # box = copy(dc.vector()[:])
     # if lb is None:
@@ -118,29 +129,38 @@ def output_assemble(dc, loop, F, scalers = None,  lb = None, k = 5):
     # box = scalers.transform(box.reshape(-1,1))
     # dc.vector()[:] = box.ravel()
     # return dc.vector()[:].reshape(-1,1), scalers, lb
-    box = adj.Function(F)
-    box.assign(dc)
+    box = field(dc).copy()
 
     if lb is None:
-        q1, q3 = np.percentile(box.vector()[:], [25, 75])
+        q1, q3 = np.percentile(box, [25, 75])
         iqr = q3 - q1
         lb = q1 - k*iqr
-    box.vector()[box.vector()[:]<lb]=box.vector()[box.vector()[:]>=lb].min()  ### outlier
+    box[box<lb]=box[box>=lb].min()  ### outlier
 
     if scalers is None:
         scalers = MinMaxScaler(feature_range=(-1,0))
-        scalers.fit(box.vector()[:].reshape(-1,1))
-    q = scalers.transform(box.vector()[:].reshape(-1,1)) ###normalize
+        scalers.fit(box.reshape(-1,1))
+    q = scalers.transform(box.reshape(-1,1)) ###normalize
     return q, scalers, lb
 
 
+@timed()
 def oc(density,dc,dv,mesh,H,Hs,volfrac,areas):
     l1 = 0
     l2 = 1e9
     move = 0.1
+    phi = field(density)
+    phi_lo = np.maximum(0.0, phi - move)
+    phi_hi = np.minimum(1.0, phi + move)
+    ratio = -field(dc) / field(dv)   ## loop-invariant part of the OC update
+    phi_new = np.empty_like(phi)
+    target = volfrac*areas.sum()
     while l2 - l1 > 1e-4:
         lmid = 0.5*(l2+l1)
-        phi_new = np.maximum(0.0, np.maximum(density.vector()[:] - move, np.minimum(1.0, np.minimum(density.vector()[:] + move, density.vector()[:] * np.sqrt(-dc.vector()[:] / dv.vector()[:] /lmid)))))
+        np.divide(ratio, lmid, out=phi_new)
+        np.sqrt(phi_new, out=phi_new)
+        np.multiply(phi, phi_new, out=phi_new)
+        np.clip(phi_new, phi_lo, phi_hi, out=phi_new)
         rho_new = filter(H,Hs,phi_new)
-        l1, l2 = (lmid, l2) if (rho_new*areas).sum() - volfrac*areas.sum() > 0 else (l1, lmid)
+        l1, l2 = (lmid, l2) if (rho_new*areas).sum() - target > 0 else (l1, lmid)
     return phi_new
\ No newline at end of file
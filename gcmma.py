@@ -0,0 +1,60 @@
+import numpy as np
+
+from MMA import asymp, concheck, gcmmasub, raaupdate
+
+
+class GCMMA:
+    """Globally convergent MMA driver around MMA.gcmmasub/asymp/raaupdate/concheck.
+
+    ``step`` performs one outer iteration from the given (fine) function values
+    and gradients. Inner iterations only need f0 and f at the trial points;
+    they come from ``evaluate(xmma) -> (f0, fval)``, which the caller backs
+    with the surrogate, so no fine solve happens inside. Without ``evaluate``
+    the first subproblem solution is accepted (plain MMA step).
+    """
+
+    def __init__(self, n, m, xmin, xmax, a0, a, c, d, max_inner=10, epsimin=1e-7, raa0eps=1e-6, raaeps=None):
+        self.n = n
+        self.m = m
+        self.xmin = xmin
+        self.xmax = xmax
+        self.a0, self.a, self.c, self.d = a0, a, c, d
+        self.max_inner = max_inner
+        self.epsimin = epsimin
+        self.raa0eps = raa0eps
+        self.raaeps = 1e-6*np.ones((m, 1)) if raaeps is None else raaeps
+        self.outer = 0
+        self.xold1 = None
+        self.xold2 = None
+        self.low = None
+        self.upp = None
+        self.inner = []   ## inner iterations per outer iteration
+        self.kkt = None   ## (xmma, ymma, zmma, lam, xsi, eta, mu, zet, s) of the last subproblem
+        self.f0est = None   ## evaluate()'s objective at the accepted point
+
+    def step(self, xval, f0val, df0dx, fval, dfdx, evaluate=None):
+        self.outer += 1
+        if self.xold1 is None:
+            self.xold1, self.xold2 = xval.copy(), xval.copy()
+        low, upp, raa0, raa = asymp(self.outer, self.n, xval, self.xold1, self.xold2, self.xmin, self.xmax,
+                                    self.low, self.upp, self.raa0eps, self.raaeps, self.raa0eps, self.raaeps, df0dx, dfdx)
+        sub = lambda raa0, raa: gcmmasub(self.m, self.n, self.outer, self.epsimin, xval, self.xmin, self.xmax, low, upp,
+                                         raa0, raa, f0val, df0dx, fval, dfdx, self.a0, self.a, self.c, self.d)
+        xmma, ymma, zmma, lam, xsi, eta, mu, zet, s, f0app, fapp = sub(raa0, raa)
+        inner = 0
+        self.f0est = None
+        if evaluate is not None:
+            trial = lambda x: [np.reshape(v, shape) for v, shape in zip(evaluate(x), [(1, 1), (self.m, 1)])]
+            f0new, fnew = trial(xmma)
+            while not concheck(self.m, self.epsimin, f0app, f0new, fapp, fnew) and inner < self.max_inner:
+                inner += 1
+                raa0, raa = raaupdate(xmma, xval, self.xmin, self.xmax, low, upp, f0new, fnew, f0app, fapp,
+                                      raa0, raa, self.raa0eps, self.raaeps, self.epsimin)
+                xmma, ymma, zmma, lam, xsi, eta, mu, zet, s, f0app, fapp = sub(raa0, raa)
+                f0new, fnew = trial(xmma)
+            self.f0est = float(np.ravel(f0new)[0])
+        self.inner.append(inner)
+        self.xold2, self.xold1 = self.xold1, xval.copy()
+        self.low, self.upp = low, upp
+        self.kkt = (xmma, ymma, zmma, lam, xsi, eta, mu, zet, s)
+        return xmma
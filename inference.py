@@ -0,0 +1,118 @@
+import copy
+import os
+import tempfile
+import warnings
+
+import numpy as np
+import torch
+import torch_geometric as pyg
+
+from model import autocast
+
+BACKENDS = ('eager', 'torchscript', 'onnx', 'compile', 'int8')
+RTOL = {'eager': 0.0, 'torchscript': 1e-4, 'onnx': 1e-4, 'compile': 1e-4, 'int8': 5e-2}   ## max |y - y_eager| / max |y_eager|
+
+
+def _to_torch_linear(net):
+    ## PyG convs wrap their own Linear; swap it for torch.nn.Linear so dynamic quantization picks it up
+    for module in list(net.modules()):
+        for name, lin in list(module.named_children()):
+            if isinstance(lin, pyg.nn.dense.linear.Linear):
+                new = torch.nn.Linear(lin.in_channels, lin.out_channels, bias=lin.bias is not None)
+                with torch.no_grad():
+                    new.weight.copy_(lin.weight)
+                    if lin.bias is not None:
+                        new.bias.copy_(lin.bias)
+                setattr(module, name, new)
+    return net
+
+
+INPUT_NAMES = ['x', 'edge_index', 'pool', 'coarse_edge_index', 'xc']
+
+
+def _doubled(inputs):
+    ## the same graph twice as one disconnected graph: another size, and the output is the first one twice
+    x, edge_index = inputs[:2]
+    out = [torch.cat([x, x]), torch.cat([edge_index, edge_index + x.shape[0]], 1)]
+    if len(inputs) > 2:
+        pool, coarse_edge_index, xc = inputs[2:]
+        out += [torch.cat([pool, pool + xc.shape[0]]), torch.cat([coarse_edge_index, coarse_edge_index + xc.shape[0]], 1),
+                torch.cat([xc, xc])]
+    return tuple(out)
+
+
+def _export(net, backend, inputs):
+    if backend == 'eager':
+        return net
+    if backend == 'torchscript':
+        traced = torch.jit.trace(net, inputs, check_trace=False)
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    if backend == 'compile':
+        return torch.compile(net, dynamic=True)
+    if backend == 'int8':
+        return torch.ao.quantization.quantize_dynamic(_to_torch_linear(net), {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == 'onnx':
+        import onnxruntime as ort
+        names = INPUT_NAMES[:len(inputs)]
+        dynamic_axes = {'x': {0: 'n'}, 'edge_index': {1: 'e'}, 'pool': {0: 'n'}, 'coarse_edge_index': {1: 'ec'}, 'xc': {0: 'nc'},
+                        'y': {0: 'n'}}
+        with tempfile.TemporaryDirectory() as tmp:   ## the session holds the model in memory, the file is not needed after
+            path = os.path.join(tmp, "gnn.onnx")
+            torch.onnx.export(net, inputs, path, input_names=names, output_names=['y'],
+                              dynamic_axes={k: v for k, v in dynamic_axes.items() if k in names + ['y']}, opset_version=17)
+            session = ort.InferenceSession(path, providers=['CPUExecutionProvider'])
+        return lambda *inputs: torch.from_numpy(
+            session.run(None, {name: value.numpy() for name, value in zip(names, inputs)})[0])
+    raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}.")
+
+
+class Predictor:
+    """Frozen inference artifact of a trained network.
+
+    The artifact is built on the first call, using that call's inputs as the
+    example for tracing/export, and checked against the eager output on those
+    inputs and on a graph of another size (later calls only carry the dirty
+    patches); if the export fails or its max. error relative to the eager
+    output exceeds ``rtol`` (default per backend, ``RTOL``) the eager network
+    is used. A later call that raises or returns the wrong shape also switches
+    to the eager network for good.
+    """
+
+    def __init__(self, net, backend='eager', rtol=None, precision='fp32'):
+        self.net = copy.deepcopy(net).eval()
+        self.backend = backend
+        self.precision = precision
+        self.rtol = RTOL.get(backend, 0.0) if rtol is None else rtol
+        self.fn = None
+        self.error = None
+
+    def __call__(self, *inputs):
+        with torch.no_grad(), autocast(inputs[0].device, self.precision):
+            if self.fn is None:
+                self.build(inputs)
+            if self.fn is self.net:
+                return self.net(*inputs).float()
+            try:
+                y = self.fn(*inputs)
+                if y.shape[0] != inputs[0].shape[0] or not y.is_floating_point():
+                    raise ValueError(f"output {tuple(y.shape)} {y.dtype} for {inputs[0].shape[0]} nodes")
+            except Exception as e:
+                warnings.warn(f"{self.backend} failed on a new input ({e}), falling back to eager.")
+                self.fn, self.error = self.net, 0.0
+                y = self.net(*inputs)
+            return y.float()
+
+    def build(self, inputs):
+        reference = self.net(*inputs)
+        try:
+            self.fn = _export(copy.deepcopy(self.net), self.backend, inputs)
+            scale = max(reference.float().abs().max().item(), 1e-12)
+            self.error = (self.fn(*inputs).float() - reference.float()).abs().max().item()/scale
+            y = self.fn(*_doubled(inputs)).float()
+            self.error = max(self.error, (y - torch.cat([reference, reference]).float()).abs().max().item()/scale)
+        except Exception as e:
+            warnings.warn(f"{self.backend} export failed ({e}), falling back to eager.")
+            self.fn, self.error = self.net, 0.0
+        if not np.isfinite(self.error) or self.error > self.rtol:
+            warnings.warn(f"{self.backend} deviates from eager by {self.error:.3e} (relative), falling back to eager.")
+            self.fn, self.error = self.net, 0.0
@@ -1,103 +1,161 @@
+import argparse
+import contextlib
+import copy
+import json
 import os
 import random
 import shutil
-import sys
 from time import time
 
 import matplotlib.pyplot as plt
-import matplotlib.tri as mtri
 import numpy as np
 import pandas as pd
 import torch
-import torch_geometric as pyg
-from fenics import (FunctionSpace, XDMFFile, as_backend_type,
-                    dof_to_vertex_map, dx, grad, inner, parameters, plot,
-                    set_log_active)
+from fenics import dx, inner, plot, set_log_active
 from fenics_adjoint import (Constant, Control, Function, assemble,
-                            assemble_system, compute_gradient, interpolate,
-                            project, solve)
-from matplotlib.tri import Triangulation
-from torch_geometric.data import Data
-
-from fem import (build_weakform_filter, build_weakform_struct, epsilon,
-                 input_assemble, oc, output_assemble, sigma)
-from mesh import (get_clever2d_mesh, get_clever3d_mesh, get_dof_map,
-                  get_halfcircle2d_mesh, get_hook2d_mesh, get_hook3d_mesh,
-                  get_lshape2d_mesh, get_mbb2d_mesh, get_mbb3d_mesh,
-                  get_wrench2d_mesh)
-from MMA import mmasub
-from model import (MyGNN, generate_data, graph_partitioning, pred_input,
-                   training)
-from utils import (compute_tetra_area, compute_theta_error,
-                   compute_triangle_area, convolution_operator, dropping,
-                   dropping2, filter, map_density, tree_maker)
+                            assemble_system, compute_gradient,
+                            continue_annotation, pause_annotation, solve)
+
+from checkpoint import (CheckpointWriter, load_checkpoint, on_preemption,
+                        rng_state, set_rng_state)
+from control import FineScheduler, Termination
+from fastmma import mmasub
+from fem import (build_weakform_struct, epsilon, input_assemble, oc,
+                 output_assemble, sigma)
+from gcmma import GCMMA
+from inference import Predictor
+from mesh import set_scratch_dir
+from MMA import kktcheck
+from model import (ARCHS, BackgroundTrainer, PatchTracker, generate_dataset,
+                   load_model, model_from_state, model_state, predict,
+                   save_model, training)
+from problem import ProblemSetup
+from store import SnapshotStore
+from telemetry import Telemetry
+from timing import TIMER, peak_rss, phase, profile
+from utils import (compute_theta_error, dropping, field, filter, map_density,
+                   sync)
+from writer import ResultWriter
 
 set_log_active(False)
 torch.cuda.empty_cache()
-if os.path.exists("/workspace/output"):
-    shutil.rmtree("/workspace/output")
-SAVE_DIR = XDMFFile("output/result.xdmf")
-os.mkdir("/workspace/output")
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
-
-def main(volfrac, maxiter, N, hmax, hamxC, rmin, Ni, Nf, Wi, Wu, target_step_per_epoch, epochs, n_hidden, n_layer, lr, optimizer, continuation):
+CONVERGENCE = dict(kkt_tol=None, change_tol=0.01, comp_tol=1e-3, window=5, min_iter=50)   ## stop tests of --convergence
+
+DEFAULTS = dict(   ## run parameters of main(), shared by __main__ and batch.py
+    volfrac=0.15,
+    maxiter=300,
+    N=200,   ## number of elem in patch
+    hmax=0.09,
+    hmaxC=None,   ## None -> 4 hmax
+    rmin=None,   ## None -> 2.5 hmax
+    Ni=15,
+    Nf=5,
+    Wi=10,
+    Wu=5,
+    target_step_per_epoch=10,
+    epochs=3,
+    n_hidden=[512, 1024, 512],
+    n_layer=3,
+    lr=0.0005,
+    optimizer=1,   ####   0 --> MMA,   1 --> OC,   2 --> GCMMA (surrogate inner iterations)
+    continuation=False,
+    geometry='hook3d',
+    surrogate=True,   ## False -> pure FE: fine sensitivity every iteration
+    init_model=None,   ## checkpoint of a previous run (e.g. coarser mesh) to fine-tune from
+    convergence=None,   ## stop tests (e.g. CONVERGENCE), None -> off: always run maxiter iterations
+    schedule=dict(adaptive=False, theta_tol=10.0, drift_tol=0.1, var_tol=0.05, trend_tol=0.05),   ## fine-solve scheduling
+    arch='gcn',   ## 'gcn' -> MyGNN, 'hier' -> HierGNN (coarse mesh as pooling level)
+    precision='fp32',   ## 'bf16' -> CPU autocast for training and inference
+    backend='eager',   ## inference backend: eager, torchscript, onnx, compile, int8
+    backend_rtol=None,   ## max. relative deviation from eager before falling back (None -> inference.RTOL per backend)
+    n_procs=1,   ## data-parallel training processes (gloo, CPU only)
+    async_training=False,   ## retrain on a worker thread while the loop continues
+    mc_samples=0,   ## MC-dropout samples per prediction (0 -> off, only needed for the adaptive var signal)
+    mma_dtype=np.float64,   ## np.float32 -> single-precision n-sized MMA arrays
+    mma_threads=1,   ## threads for the chunked MMA subproblem
+    snapshot_budget=2*1024**3,   ## bytes of snapshots kept in RAM, rest spilled to disk (None -> all in RAM)
+    cache_dir="/workspace/cache",   ## mesh-derived artifacts (H, transfer, patch graphs) reused across runs (None -> off)
+    checkpoint_every=10,   ## iterations between checkpoints (and on SIGTERM)
+    result_stride=10,   ## iterations between density/sensitivity steps of results/series.xdmf (None -> final design only)
+    result_displacement=False,   ## also write the fine displacement (fine iterations only)
+    profile_iters=(),   ## iterations captured with cProfile into results/profile/
+    torch_profile=False,   ## also capture them with torch.profiler (chrome trace)
+)
+
+
+def params(**overrides):
+    ## DEFAULTS with overrides, hmaxC and rmin resolved from hmax
+    out = {**copy.deepcopy(DEFAULTS), **overrides}
+    out['hmaxC'] = out['hmaxC'] or 4*out['hmax']
+    out['rmin'] = out['rmin'] or 2.5*out['hmax']
+    return out
+
+
+def prepare_output(output_dir="/workspace/output"):
+    ## fresh scratch directory for the mesh generators (was done at import time)
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    set_scratch_dir(output_dir)
+
+
+def main(volfrac, maxiter, N, hmax, hmaxC, rmin, Ni, Nf, Wi, Wu, target_step_per_epoch, epochs, n_hidden, n_layer, lr, optimizer, continuation,
+         snapshot_dir=None, snapshot_budget=None, patch_tol=1e-3,
+         schedule=None, mc_samples=0, async_training=False, n_procs=1,
+         backend='eager', backend_rtol=None, precision='fp32', geometry='hook3d', init_model=None, Ni_ft=2, Wi_ft=1,
+         arch='gcn', mma_dtype=np.float64, mma_threads=1, convergence=None,
+         checkpoint=None, checkpoint_every=10, resume=False, result_stride=10, result_displacement=False,
+         profile_iters=(), torch_profile=False, telemetry=None, surrogate=True, results_dir="/workspace/results",
+         setup=None, cache_dir=None):
     t_start = time()
-    ## time
-    t_data  = []  # input , output data assemble
-    t_fine   = []  ## dc, dv, fine
-    t_coarse = []
-    t_overhead = []
-    t_training=[]
-    t_pred=[]
-    t_optimizer=[]
-    input_apd=[]
-    output_apd=[]
+    os.makedirs(results_dir, exist_ok=True)
+    snapshot_dir = snapshot_dir or os.path.join(results_dir, "snapshots")
+    TIMER.reset()   ## phases: data, fine, coarse, overhead, training, pred, optimizer, volume (+ decorated kernels)
+    state = load_checkpoint(checkpoint, device) if resume and checkpoint is not None else None
+    open_store = SnapshotStore if state is None else SnapshotStore.load   ## keep the snapshots of the resumed run
+    input_apd = open_store(os.path.join(snapshot_dir, "input"), snapshot_budget)   ## features per iteration
+    output_apd = open_store(os.path.join(snapshot_dir, "output"), snapshot_budget)  ## targets per fine iteration
     data_size = []
 
-    mesh, V, F, bcs, t, ds, u, du, rho, drho, part_info, t_part_info = get_hook3d_mesh(hmax=hmax, N=N)
-    meshC, VC, FC, bcsC, tC, dsC, uC, duC, _, _, _ , _= get_hook3d_mesh(hmax = hmaxC)
-    t_overhead.append(t_part_info)
+    if setup is None:   ## a batch run passes the setup shared by its group (batch.py)
+        with phase("setup"):
+            setup = ProblemSetup(geometry, hmax, hmaxC, N, rmin, hier=arch == 'hier', cache_dir=cache_dir)   ## loop invariants, built once
+    mesh, V, F, bcs, t, ds, u, du = setup.mesh, setup.V, setup.F, setup.bcs, setup.t, setup.ds, setup.u, setup.du
+    meshC, VC, FC, bcsC, tC, dsC, uC, duC = setup.meshC, setup.VC, setup.FC, setup.bcsC, setup.tC, setup.dsC, setup.uC, setup.duC
+    part_info, partitioned_graphs = setup.part_info, setup.partitioned_graphs
+    v2dC, dim, center, areas, H, Hs = setup.v2dC, setup.dim, setup.center, setup.areas, setup.H, setup.Hs
+    TIMER.add("setup/partition", setup.t_part_info)
 
     print("fine :", mesh.num_cells(),",","Coarse :", meshC.num_entities(0),",","Patch :", len(part_info['nodes']))
-    v2dC, d2vC = get_dof_map(FC)
-    dim = u.ufl_shape[0]
-    coords = mesh.coordinates()
-    coordsC = meshC.coordinates()
-    trias = mesh.cells()
-    center = coords[trias].mean(1)
-    if dim == 2:
-        areas = compute_triangle_area(coords[trias])
-    else:
-        areas = compute_tetra_area(coords[trias])
-
-    H = convolution_operator(center, rmin)
-    Hs = H@np.ones(mesh.num_cells())
+    print(f"setup : {setup.t_setup:.3f}" + (" (cached)" if setup.cache_hit else ""))
 
     uh = Function(V)
     phih = Function(F)   ## density
-    phih.vector()[:] = volfrac
+    field(phih)[:] = volfrac
+    sync(phih)
     dc_pred = Function(F)
 
     dc_bar = Function(F)
     dv_bar = Function(F)
-    dc_pred_bar = Function(F)
+    field(dv_bar)[:] = setup.dv_bar   ## the volume sensitivity does not depend on the design
+    sync(dv_bar)
     
     rhoh = Function(F)   ## Filtered density
     m = Control(phih)
     obj_hist = []
 
-    if continuation:
-        penal = Constant(1.0)
-    else:
-        penal = Constant(3.0)
+    penal = Constant(1.0 if continuation else 3.0)   ## changed in place with assign, the forms are built once
     ## MMA parameters
-    if optimizer == 0:
+    gcmma = None
+    comp_est = None   ## GCMMA objective estimate of the surrogate phase
+    kkt_state = None   ## MMA/GCMMA subproblem solution and multipliers of the last step
+    if optimizer in (0, 2):
         mm = 1
         n = mesh.num_cells()
         xmin = np.zeros((n,1))
         xmax = np.ones((n,1))
-        xval = phih.vector()[:][np.newaxis].T
+        xval = field(phih).reshape(-1,1).copy()
         xold1 = xval.copy()
         xold2 = xval.copy()
         low = np.ones((n,1))
@@ -107,229 +165,410 @@ def main(volfrac, maxiter, N, hmax, hamxC, rmin, Ni, Nf, Wi, Wu, target_step_per
         c = 100000*np.ones((mm,1))
         d = np.zeros((mm,1))
         move = 0.2
+        gcmma = GCMMA(n, mm, xmin, xmax, a0, aa, c, d) if optimizer == 2 else None
 
     # aH, LH = build_weakform_filter(rho, drho, phih, rmin) #### filter equation
-    a, L = build_weakform_struct(u, du, rhoh, t, ds, penal) #### FEA-fine
+    a, L = build_weakform_struct(u, du, rhoh, t, ds, penal, loadArea=setup.load_area) #### FEA-fine
+    Ws = inner(sigma(uh,rhoh,penal), epsilon(uh))*dx   #### compliance
     uhC = Function(VC)
     rhohC = Function(FC)
-    aC, LC = build_weakform_struct(uC, duC, rhohC, tC, dsC, penal) #### FEA-coarse
-
-    tic = time()
-    partitioned_graphs = graph_partitioning(coords, trias, part_info, center, mesh)
-    if dim == 2:
-        T = Triangulation(*meshC.coordinates().T, triangles=meshC.cells())
-    batch_size = np.ceil(len(part_info['nodes'])/target_step_per_epoch).astype(int).item()
-    # fcc2cn = tree_maker(center, meshC)
-    t_overhead.append(time()-tic)
+    ## the coarse problem keeps the initial penalization
+    aC, LC = build_weakform_struct(uC, duC, rhohC, tC, dsC, Constant(penal.values()[0]), loadArea=setup.load_areaC) #### FEA-coarse
+
+    with phase("overhead"):
+        torch.save({'partitioned_graphs': partitioned_graphs, 'elems': part_info['elems']},
+                   os.path.join(snapshot_dir, "patches.pt"))  ## for offline reuse of the snapshots
+        batch_size = np.ceil(len(part_info['nodes'])/target_step_per_epoch).astype(int).item()
+        # fcc2cn = tree_maker(center, meshC)
+        tracker = PatchTracker(part_info['index'], mesh.num_cells(), patch_tol)
+        trial_tracker = PatchTracker(part_info['index'], mesh.num_cells(), patch_tol)   ## GCMMA trial points, own cache
+        meta = dict(geometry=geometry, dim=dim, hmax=hmax, hmaxC=hmaxC, rmin=rmin, N=N)
+        net, scaler, scalers, lb = None, None, None, None
+        train_hist, val_hist = [], []
+        runner = None   ## optimized inference artifact of net
+        if init_model is not None:   ## warm start, go straight into a short fine-tuning phase
+            ## weights only: the scalers and lb are refit on this run's first snapshots, fine sensitivities
+            ## scale with the cell volume and the coarse strains with hmaxC, so the source run's ranges do not fit
+            net, _, _, _, meta_init = load_model(init_model, device)
+            if not isinstance(net, ARCHS[arch]):
+                raise ValueError(f"Checkpoint {init_model} holds a {type(net).__name__}, expected arch '{arch}'.")
+            if meta_init.get('dim', dim) != dim:
+                raise ValueError(f"Checkpoint {init_model} was trained in {meta_init['dim']}D, this problem is {dim}D.")
+            runner = Predictor(net, backend, backend_rtol, precision)
+            changed = {k: (meta_init.get(k), v) for k, v in meta.items() if meta_init.get(k) != v}
+            print("warm start from", init_model, ",changed :", changed)
+            Ni, Wi = Ni_ft, Wi_ft
+        scheduler = FineScheduler(Ni, Wi, Nf, **(schedule or {}))
+        termination = Termination(**(convergence or {}))
+        trainer = BackgroundTrainer() if async_training else None
+        train_job = None   ## (input, output snapshot, drop_patch) of the running background job
+
+    def surrogate_eval(phi, phi0, f0, g0):
+        ## GCMMA trial point: exact volume, compliance by the trapezoid rule with the surrogate gradient at phi
+        pause_annotation()
+        try:
+            field(phih)[:] = phi.ravel()
+            sync(phih)
+            filter(H,Hs,field(phih),out=field(rhoh))
+            sync(rhoh)
+            map_density(rhoh, rhohC, mesh, meshC, None, v2dC)
+            AC, bC = assemble_system(aC, LC, bcsC)
+            solve(AC, uhC.vector(), bC)
+            x, _ = input_assemble(rhoh, uhC, V, F, FC, v2dC, center, scaler=scaler, transfer=setup.transfer)
+            g1, _ = predict(net, x, trial_tracker, partitioned_graphs, part_info['index'], scalers, device, runner=runner, record=False)
+        finally:
+            continue_annotation()
+        f0 = f0 + 0.5*np.dot(np.ravel(g0) + g1, phi.ravel() - phi0.ravel())
+        return f0, np.array([[(field(rhoh)*areas).sum() - volfrac*setup.area]])
 
     loop = 0
     iteration = 0
+    if state is not None:   ## continue from the checkpoint
+        loop, iteration = state['loop'], state['iteration']
+        penal.assign(state['penal'])
+        field(phih)[:] = state['phih']
+        sync(phih)
+        if state['mma'] is not None:
+            xold1, xold2, low, upp = state['mma']
+        gcmma, kkt_state, comp_est = state['gcmma'], state['kkt_state'], state['comp_est']
+        comp, vol, obj_hist, data_size = state['comp'], state['vol'], state['obj_hist'], state['data_size']
+        scaler, scalers, lb = state['scaler'], state['scalers'], state['lb']
+        if state['model'] is not None:
+            net = model_from_state(state['model'], device)[0]
+            runner = Predictor(net, backend, backend_rtol, precision)
+        scheduler, termination, tracker = state['scheduler'], state['termination'], state['tracker']
+        trial_tracker = state.get('trial_tracker', trial_tracker)
+        input_apd.truncate(state['snapshots'][0])
+        output_apd.truncate(state['snapshots'][1])
+        train_job = state.get('train_job')
+        if train_job is not None and trainer is not None:   ## background job unfinished at the checkpoint: run it again
+            i, o, mask = train_job
+            dataset = generate_dataset(input_apd[i], output_apd[o], partitioned_graphs, part_info['index'], mask)
+            trainer.submit(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net, n_procs, precision, arch)
+        TIMER.records.update(state['times'])
+        t_start = time() - state['elapsed']
+        set_rng_state(state['rng'])
+        print("resumed from", checkpoint, "at it.:", loop)
+    writer = CheckpointWriter(checkpoint) if checkpoint is not None else None
+    events = Telemetry(telemetry, run=state.get('run') if state is not None else None) \
+        if telemetry is not None else None   ## one JSON line per iteration, a resumed run keeps its run id
+    series = ResultWriter(os.path.join(results_dir, "series"), mesh.coordinates(), mesh.cells(), result_stride,
+                          resume=loop if state is not None else None)   ## mesh written once, a resumed run appends
+    preempted = on_preemption() if checkpoint is not None else None
+
+    def run_state():
+        ## everything the loop needs to continue (the snapshots are persisted by the writer thread); a background
+        ## training job still running is recorded as train_job and resubmitted on resume
+        return dict(loop=loop, iteration=iteration, penal=float(penal.values()[0]), phih=field(phih).copy(),
+                    mma=(xold1, xold2, low, upp) if optimizer == 0 else None,
+                    gcmma=gcmma, kkt_state=kkt_state, comp_est=comp_est,
+                    comp=comp, vol=vol, obj_hist=obj_hist, data_size=data_size,
+                    scaler=scaler, scalers=scalers, lb=lb,
+                    model=model_state(net, n_hidden, n_layer, scaler, scalers, lb, meta) if net is not None else None,
+                    scheduler=scheduler, termination=termination, tracker=tracker, trial_tracker=trial_tracker,
+                    snapshots=(len(input_apd), len(output_apd)), train_job=train_job, times=dict(TIMER.records),
+                    elapsed=time()-t_start, rng=rng_state(), run=events.run if events is not None else None)
+
+    def save_checkpoint(step):
+        ## every checkpoint_every steps and on SIGTERM; True on preemption, the writers are closed and the caller returns
+        if writer is None or (step % checkpoint_every and not preempted.is_set()):
+            return False
+        writer.save(run_state(), before=(input_apd.pending(), output_apd.pending()))
+        if not preempted.is_set():
+            return False
+        if trainer is not None:   ## the job is in the checkpoint; don't let it outlast the grace period
+            trainer.shutdown(cancel=True)
+        writer.close()
+        series.close()
+        if events is not None:
+            events.close()
+        print("preempted, checkpoint written at it.:", step)
+        return True
 
     while iteration < 40 and continuation:
 
         rhoh.assign(phih)
-        rhoh.vector()[:] = filter(H,Hs,rhoh.vector()[:])
+        filter(H,Hs,field(phih),out=field(rhoh))
+        sync(rhoh)
  
-        tic = time()
-        a, L = build_weakform_struct(u, du, rhoh, t, ds, penal)
-        A, b = assemble_system(a,L,bcs)
-        solve(A,uh.vector(),b)
-        Ws = inner(sigma(uh,rhoh,penal), epsilon(uh))
-        comp = assemble(Ws*dx)
-        vol = (rhoh.vector()[:]*areas).sum()
-        dc = compute_gradient(comp, m)
-        t_fine.append(time()-tic)
-
-        dc_bar.vector()[:] = filter(H,Hs,dc.vector()[:])
-        dv_bar.vector()[:] = filter(H,Hs,areas)
-
-        tic = time()
-        if optimizer == 0:
-            mu0 = 1.0
-            mu1 = 1.0
-            f0val = comp
-            df0dx = dc_bar.vector()[:].reshape(-1,1)
-            fval = np.array([[vol - volfrac*areas.sum()]])
-            dfdx = dv_bar.vector()[:].reshape(1,-1)
-            xval = phih.vector()[:].reshape(-1,1)
-            xmma,ymma,zmma,lam,xsi,eta,mu,zet,s,low,upp = \
-                mmasub(mm,n,iteration,xval,xmin,xmax,xold1,xold2,f0val,df0dx,fval,dfdx,low,upp,a0,aa,c,d,move)
-            xold2 = xold1.copy()
-            xold1 = xval.copy()
-            phih.vector()[:] = xmma.ravel()
-        elif optimizer == 1:
-            phih.vector()[:] = oc(phih,dc_bar,dv_bar,mesh,H,Hs,volfrac,areas)
-        t_optimizer.append(time()-tic)
-
-        if iteration == 19:
-            penal = Constant(2.0)
-        iteration += 1
-        print(f"it.: {iteration: 3d},\tobj.: {comp:.4e},\tvol.: {vol/areas.sum():.3f},\tpenal.: {penal.values()[0]}")
+        with phase("fine"):
+            A, b = assemble_system(a,L,bcs)
+            solve(A,uh.vector(),b)
+            comp = assemble(Ws)
+            vol = (field(rhoh)*areas).sum()
+            dc = compute_gradient(comp, m)
 
-    penal = Constant(3.0)
-    if continuation:
-        a, L = build_weakform_struct(u, du, rhoh, t, ds, penal)
-    while loop < maxiter:
-        rhoh.assign(phih)
-        rhoh.vector()[:] = filter(H,Hs,rhoh.vector()[:])
-
-        map_density(rhoh, rhohC, mesh, meshC, None, v2dC)
-        tic = time()
-        # rhohC.vector()[v2dC] = rhoh.vector()[fcc2cn] ## density mapping
-        drop_patch = dropping(part_info, rhoh)
-        t_overhead.append(time()-tic)
-
-        tic = time()
-        AC, bC = assemble_system(aC, LC, bcsC)
-        solve(AC, uhC.vector(), bC)
-        # solve(aC == LC, uhC, bcs=bcsC)  ##  Coarse FE
-        t_coarse.append(time()-tic)
-
-        tic = time()
-        if dim == 2:
-            x, scaler = input_assemble(rhoh, uhC, V, F, FC, v2dC, center, _, T, scaler if loop > 0 else None)
-        else:
-            x, scaler = input_assemble(rhoh, uhC, V, F, FC, v2dC, center,coordsC, _, scaler if loop > 0 else None)
-        x_last = x  
-        input_apd.append(x)
-        t_data.append(time()-tic)
-                
-        if(loop<Ni+Wi) or (divmod(max(loop-Ni-Wi,1),Nf)[1]==0):
-            tic = time()
-            A,b = assemble_system(a, L, bcs)
-            solve(A, uh.vector(), b)
-            # solve(a == L, uh, bcs)
-
-            Ws = inner(sigma(uh,rhoh,penal), epsilon(uh))
-            comp = assemble(Ws*dx)
-            comp_old = comp
-            obj_hist.append([loop, comp])
-            vol = (rhoh.vector()[:]*areas).sum()
-            dc = compute_gradient(comp, m)   ### fine sensitivity
-            t_fine.append(time()-tic)
-
-            dc_bar.vector()[:] = filter(H,Hs,dc.vector()[:])
-            dv_bar.vector()[:] = filter(H,Hs,areas)
-
-            ## Store
-            tic = time()
-            y, scalers, lb = output_assemble(
-                dc_bar, loop, F, scalers if loop > 0 else None, lb if loop > 0 else None,
-                k=2)
-            output_apd.append(y)
-            t_data.append(time()-tic)
+        filter(H,Hs,field(dc),out=field(dc_bar))
+        sync(dc_bar)
 
-        
-            if loop == Ni + Wi -1:
-                data_list = []
-                tic = time()
-                for i in range(Wi):
-                    data_list.append([generate_data(input_apd[-(i+1)], output_apd[-(i+1)], edge_ids, elem_ids, mesh) for edge_ids, elem_ids in zip(partitioned_graphs, part_info['elems'])])
-                # dataset = sum(data_list,[])
-                dataset = [data_list[0][i] for i, value in enumerate(drop_patch) if value]
-                data_size.append(len(dataset))
-                t_data.append(time()-tic)
-
-                tic = time()
-                train_hist, val_hist, net  = training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device)
-                t_training.append(time()-tic)
-            elif divmod(max(loop-Ni-Wi,1), Nf)[1] == 0:
-                data_list = []
-                tic = time()
-                for i in range(Wu):
-                    data_list.append([generate_data(input_apd[-(i+1)], output_apd[-(i+1)], edge_ids, elem_ids,mesh) for edge_ids, elem_ids in zip(partitioned_graphs, part_info['elems'])])
-                # dataset = sum(data_list,[])
-                dataset = [data_list[0][i] for i, value in enumerate(drop_patch) if value]
-                data_size.append(len(dataset))
-                t_data.append(time()-tic)
-
-                tic = time()
-                train_hist, val_hist, net = training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net)
-                t_training.append(time()-tic)
-
-            ## Optimizer parameters
-            tic = time()
+        with phase("optimizer"):
             if optimizer == 0:
                 mu0 = 1.0
                 mu1 = 1.0
                 f0val = comp
-                df0dx = dc_bar.vector()[:].reshape(-1,1)
-                fval = np.array([[vol - volfrac*areas.sum()]])
-                dfdx = dv_bar.vector()[:].reshape(1,-1)
-                xval = phih.vector()[:].reshape(-1,1)
+                df0dx = field(dc_bar).reshape(-1,1)
+                fval = np.array([[vol - volfrac*setup.area]])
+                dfdx = field(dv_bar).reshape(1,-1)
+                xval = field(phih).reshape(-1,1).copy()
                 xmma,ymma,zmma,lam,xsi,eta,mu,zet,s,low,upp = \
-                    mmasub(mm,n,loop,xval,xmin,xmax,xold1,xold2,f0val,df0dx,fval,dfdx,low,upp,a0,aa,c,d,move)
+                    mmasub(mm,n,iteration,xval,xmin,xmax,xold1,xold2,f0val,df0dx,fval,dfdx,low,upp,a0,aa,c,d,move,mma_dtype,mma_threads)
                 xold2 = xold1.copy()
                 xold1 = xval.copy()
-                phih.vector()[:] = xmma.ravel()
+                kkt_state = (xmma,ymma,zmma,lam,xsi,eta,mu,zet,s)
+                field(phih)[:] = xmma.ravel()
+                sync(phih)
             elif optimizer == 1:
-                phih.vector()[:] = oc(phih, dc_bar, dv_bar, mesh, H, Hs, volfrac, areas)
-            t_optimizer.append(time()-tic)
+                field(phih)[:] = oc(phih,dc_bar,dv_bar,mesh,H,Hs,volfrac,areas)
+                sync(phih)
+            elif optimizer == 2:
+                xval = field(phih).reshape(-1,1).copy()
+                xmma = gcmma.step(xval, comp, field(dc_bar).reshape(-1,1), np.array([[vol - volfrac*setup.area]]),
+                                  field(dv_bar).reshape(1,-1))
+                kkt_state = gcmma.kkt
+                field(phih)[:] = xmma.ravel()
+                sync(phih)
+
+        if iteration == 19:
+            penal.assign(2.0)
+        iteration += 1
+        print(f"it.: {iteration: 3d},\tobj.: {comp:.4e},\tvol.: {vol/setup.area:.3f},\tpenal.: {penal.values()[0]}")
+        if save_checkpoint(iteration):
+            return
+
+    penal.assign(3.0)
+    while loop < maxiter:
+        prof = contextlib.ExitStack()
+        if loop in profile_iters:   ## cProfile (and torch.profiler) capture of this iteration
+            prof.enter_context(profile(os.path.join(results_dir, "profile", f"it{loop}"), torch_profile))
+        skip = None
+        kktnorm = None
+        rho_eval = None   ## density of this iteration, saved before GCMMA trial points overwrite rhoh
+        phi_old = field(phih).copy()
+        t_iter, phases0, trained0 = time(), TIMER.totals(), TIMER.count("training")
+        if trainer is not None:
+            result = trainer.poll()
+            if result is not None:   ## hot-swap the retrained network
+                train_hist, val_hist, net = result
+                train_job = None
+                tracker.reset()
+                trial_tracker.reset()
+                runner = Predictor(net, backend, backend_rtol, precision)
+        rhoh.assign(phih)
+        filter(H,Hs,field(phih),out=field(rhoh))
+        sync(rhoh)
+
+        if surrogate:   ## coarse solve and surrogate features, not needed by the pure-FE baseline
+            map_density(rhoh, rhohC, mesh, meshC, None, v2dC)
+            with phase("overhead"):
+                # rhohC.vector()[v2dC] = rhoh.vector()[fcc2cn] ## density mapping
+                drop_patch = dropping(part_info, rhoh)
+
+            with phase("coarse"):
+                AC, bC = assemble_system(aC, LC, bcsC)
+                solve(AC, uhC.vector(), bC)
+                # solve(aC == LC, uhC, bcs=bcsC)  ##  Coarse FE
+
+            with phase("data"):
+                x, scaler = input_assemble(rhoh, uhC, V, F, FC, v2dC, center, scaler=scaler, transfer=setup.transfer)
+                x_last = x  
+                input_apd.append(x, loop)
+                
+        fine = not surrogate or scheduler.fine_due(loop, x_last, net is not None)
+        if fine:
+            with phase("fine"):
+                A,b = assemble_system(a, L, bcs)
+                solve(A, uh.vector(), b)
+                # solve(a == L, uh, bcs)
+
+                comp = assemble(Ws)
+                comp_old = comp
+                obj_hist.append([loop, comp])
+                vol = (field(rhoh)*areas).sum()
+                dc = compute_gradient(comp, m)   ### fine sensitivity
+            if surrogate:
+                scheduler.record_fine(loop, x_last, comp)
+
+            filter(H,Hs,field(dc),out=field(dc_bar))
+            sync(dc_bar)
+            if kkt_state is not None:   ## KKT residual of the last subproblem solution with the fine gradient there
+                _, kktnorm, _ = kktcheck(mm, n, *kkt_state, xmin, xmax, field(dc_bar).reshape(-1,1),
+                                         np.array([[vol - volfrac*setup.area]]), field(dv_bar).reshape(1,-1), a0, aa, c, d)
+
+            if surrogate:   ## snapshots, surrogate check and retraining
+                ## Store
+                with phase("data"):
+                    y, scalers, lb = output_assemble(
+                        dc_bar, loop, F, scalers, lb,
+                        k=2)
+                    output_apd.append(y, loop)
+
+                if net is not None and scheduler.adaptive:   ## verify the surrogate against the fine sensitivity
+                    with phase("pred"):
+                        field(dc_pred)[:], _ = predict(net, x_last, tracker, partitioned_graphs, part_info['index'], scalers, device,
+                                                       runner=runner, record=False)
+                        sync(dc_pred)
+                        therr = compute_theta_error(dc_bar, dc_pred)    ###### theta_error
+                        scheduler.record_theta(therr)
+                        if loop < scheduler.warmup and therr < scheduler.theta_tol:
+                            scheduler.end_warmup(loop)
+
+                if loop == scheduler.warmup - 1 or scheduler.early_model(loop):
+                    with phase("data"):
+                        ## only the newest snapshot is trained on; the older Wi-1 were built and discarded before
+                        dataset = generate_dataset(input_apd[-1], output_apd[-1], partitioned_graphs, part_info['index'], drop_patch)
+                        data_size.append(len(dataset))
+
+                    with phase("training"):
+                        if trainer is not None:
+                            if trainer.submit(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net, n_procs, precision, arch):
+                                train_job = (len(input_apd) - 1, len(output_apd) - 1, drop_patch)
+                        else:
+                            train_hist, val_hist, net  = training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net, n_procs, precision, arch)
+                            tracker.reset()
+                            trial_tracker.reset()
+                            runner = Predictor(net, backend, backend_rtol, precision)
+                elif loop >= scheduler.warmup and not (trainer is not None and trainer.busy):
+                    with phase("data"):
+                        ## only the newest snapshot is trained on; the older Wu-1 were built and discarded before
+                        dataset = generate_dataset(input_apd[-1], output_apd[-1], partitioned_graphs, part_info['index'], drop_patch)
+                        data_size.append(len(dataset))
+
+                    with phase("training"):
+                        if trainer is not None:
+                            if trainer.submit(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net, n_procs, precision, arch):
+                                train_job = (len(input_apd) - 1, len(output_apd) - 1, drop_patch)
+                        else:
+                            train_hist, val_hist, net = training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net, n_procs, precision, arch)
+                            tracker.reset()
+                            trial_tracker.reset()
+                            runner = Predictor(net, backend, backend_rtol, precision)
+
+            ## Optimizer parameters
+            with phase("optimizer"):
+                if optimizer == 0:
+                    mu0 = 1.0
+                    mu1 = 1.0
+                    f0val = comp
+                    df0dx = field(dc_bar).reshape(-1,1)
+                    fval = np.array([[vol - volfrac*setup.area]])
+                    dfdx = field(dv_bar).reshape(1,-1)
+                    xval = field(phih).reshape(-1,1).copy()
+                    xmma,ymma,zmma,lam,xsi,eta,mu,zet,s,low,upp = \
+                        mmasub(mm,n,loop,xval,xmin,xmax,xold1,xold2,f0val,df0dx,fval,dfdx,low,upp,a0,aa,c,d,move,mma_dtype,mma_threads)
+                    xold2 = xold1.copy()
+                    xold1 = xval.copy()
+                    kkt_state = (xmma,ymma,zmma,lam,xsi,eta,mu,zet,s)
+                    field(phih)[:] = xmma.ravel()
+                    sync(phih)
+                elif optimizer == 1:
+                    field(phih)[:] = oc(phih, dc_bar, dv_bar, mesh, H, Hs, volfrac, areas)
+                    sync(phih)
+                elif optimizer == 2:   ## inner iterations on the surrogate, no extra fine solve
+                    xval = field(phih).reshape(-1,1).copy()
+                    rho_eval = field(rhoh).copy()
+                    g0 = field(dc_bar).copy()
+                    evaluate = (lambda phi: surrogate_eval(phi, xval, comp, g0)) if net is not None else None
+                    xmma = gcmma.step(xval, comp, g0.reshape(-1,1), np.array([[vol - volfrac*setup.area]]),
+                                      field(dv_bar).reshape(1,-1), evaluate)
+                    kkt_state = gcmma.kkt
+                    comp_est = comp if gcmma.f0est is None else gcmma.f0est
+                    field(phih)[:] = xmma.ravel()
+                    sync(phih)
         
         else:
-            tic = time()
-            pred_input_data = [pred_input(x_last, edge_ids, elem_ids, mesh) for edge_ids, elem_ids in zip(partitioned_graphs, part_info['elems'])]
-            # pred_loader = pyg.loader.DataLoader(pred_input_data, batch_size = batch_size*2)
-            pred_loader = pyg.loader.DataLoader(pred_input_data, batch_size = len(pred_input_data))
-            t_data.append(time()-tic)
-
-            tic = time()
-            with torch.no_grad():
-                net.eval()
-                for batch in pred_loader:
-                    yhat = net(batch.x.to(device), batch.edge_index.to(device)).cpu()
-                    dc_pred.vector()[batch.global_idx] = yhat.numpy()[:, 0]
-
-            dc_pred.vector()[:] = scalers.inverse_transform(dc_pred.vector()[:].reshape(-1,1)).ravel()
-            dc_pred.vector()[np.where(dc_pred.vector()[:]>0)[0]]=0
-            t_pred.append(time()-tic)
+            with phase("pred"):
+                field(dc_pred)[:], var = predict(net, x_last, tracker, partitioned_graphs, part_info['index'], scalers, device, mc_samples, runner)
+                sync(dc_pred)
+                skip = tracker.skip_ratio[-1]
 
             # dc_pred_bar.vector()[:] = filter(H,Hs,dc_pred.vector()[:])
             
             # therr = compute_theta_error(dc,dc_pred)    ###### theta_error
             # print(f'theta={therr:.3f}')
 
-            tic = time()
-            vol = (rhoh.vector()[:]*areas).sum()
-            t_fine.append(time()-tic)
-
-            dv_bar.vector()[:] = filter(H,Hs,areas)
+            with phase("volume"):
+                vol = (field(rhoh)*areas).sum()
 
             ## Optimizer parameters
-            tic = time()
-            if optimizer ==0:
-                mu0 = 1.0
-                mu1 = 1.0
-                f0val = comp
-                df0dx = dc_pred_bar.vector()[:].reshape(-1,1)
-                fval = np.array([[vol - volfrac*areas.sum()]])
-                dfdx = dv_bar.vector()[:].reshape(1,-1)
-                xval = phih.vector()[:].reshape(-1,1)
-                xmma,ymma,zmma,lam,xsi,eta,mu,zet,s,low,upp = \
-                    mmasub(mm,n,loop,xval,xmin,xmax,xold1,xold2,f0val,df0dx,fval,dfdx,low,upp,a0,aa,c,d,move)
-                xold2 = xold1.copy()
-                xold1 = xval.copy()
-                phih.vector()[:] = xmma.ravel()
-            elif optimizer == 1:
-                phih.vector()[:] = oc(phih, dc_pred, dv_bar, mesh, H, Hs, volfrac,areas)
-            t_optimizer.append(time()-tic)
+            with phase("optimizer"):
+                if optimizer ==0:
+                    mu0 = 1.0
+                    mu1 = 1.0
+                    f0val = comp
+                    df0dx = field(dc_pred).reshape(-1,1)
+                    fval = np.array([[vol - volfrac*setup.area]])
+                    dfdx = field(dv_bar).reshape(1,-1)
+                    xval = field(phih).reshape(-1,1).copy()
+                    xmma,ymma,zmma,lam,xsi,eta,mu,zet,s,low,upp = \
+                        mmasub(mm,n,loop,xval,xmin,xmax,xold1,xold2,f0val,df0dx,fval,dfdx,low,upp,a0,aa,c,d,move,mma_dtype,mma_threads)
+                    xold2 = xold1.copy()
+                    xold1 = xval.copy()
+                    kkt_state = (xmma,ymma,zmma,lam,xsi,eta,mu,zet,s)
+                    field(phih)[:] = xmma.ravel()
+                    sync(phih)
+                elif optimizer == 1:
+                    field(phih)[:] = oc(phih, dc_pred, dv_bar, mesh, H, Hs, volfrac,areas)
+                    sync(phih)
+                elif optimizer == 2:   ## objective carried forward from the last trapezoid estimate
+                    xval = phi_old.reshape(-1,1)
+                    rho_eval = field(rhoh).copy()
+                    g0 = field(dc_pred).copy()
+                    xmma = gcmma.step(xval, comp_est, g0.reshape(-1,1), np.array([[vol - volfrac*setup.area]]),
+                                      field(dv_bar).reshape(1,-1), lambda phi: surrogate_eval(phi, xval, comp_est, g0))
+                    kkt_state = gcmma.kkt
+                    comp_est = gcmma.f0est
+                    field(phih)[:] = xmma.ravel()
+                    sync(phih)
+            scheduler.record_surrogate(var, np.dot(field(dc_pred), field(phih) - phi_old))
 
         # plt.cla()
         # plot(rhoh, cmap="gray_r")
         # plt.savefig("test.png")
+        if series.due(loop):   ## design and sensitivity this iteration was evaluated at
+            series.write(loop, cell=dict(density=field(rhoh) if rho_eval is None else rho_eval, sensitivity=field(dc_bar if fine else dc_pred)),
+                         node=dict(displacement=uh.compute_vertex_values(mesh).reshape(dim, -1).T)
+                         if result_displacement and fine else None)
+        prof.close()
         loop += 1
-        print(f"it.: {loop: 3d},\tobj.: {comp:.4e},\tvol.: {vol/areas.sum():.3f}")
+        print(f"it.: {loop: 3d},\tobj.: {comp:.4e},\tvol.: {vol/setup.area:.3f}" +
+              (f",\tskip: {skip:.2f}" if skip is not None else ""))
+        if events is not None:
+            phases = TIMER.totals()
+            events.record(loop=loop, kind="retrain" if TIMER.count("training") > trained0 else "fine" if fine else "surrogate",
+                          comp=comp, vol=vol/setup.area, seconds=time()-t_iter,
+                          phases={k: v - phases0.get(k, 0.0) for k, v in phases.items() if v > phases0.get(k, 0.0)},
+                          gcmma_inner=gcmma.inner[-1] if gcmma is not None and gcmma.inner else None,
+                          theta=scheduler.theta if fine else None, skip=skip,
+                          train_loss=train_hist[-1] if train_hist else None, val_loss=val_hist[-1] if val_hist else None,
+                          rss_kb=peak_rss(),
+                          gpu_mb=torch.cuda.max_memory_allocated()/1024**2 if torch.cuda.is_available() else None)
+        if termination.update(loop, fine, np.abs(field(phih) - phi_old).max(), comp if fine else None, kktnorm):
+            print("converged :", termination.reason)
+            break
+        if save_checkpoint(loop):
+            return
     t_end = time()-t_start
+    if writer is not None:
+        writer.close()
+    if trainer is not None:
+        trainer.shutdown()
+    input_apd.flush()
+    output_apd.flush()
 
     rhoh.assign(phih)
-    rhoh.vector()[:] = filter(H,Hs,rhoh.vector()[:])
-    a, L = build_weakform_struct(u, du, rhoh, t, ds, penal)
+    filter(H,Hs,field(phih),out=field(rhoh))
+    sync(rhoh)
     A, b = assemble_system(a, L, bcs)
     # solve(a == L, uh, bcs=bcs,solver_parameters={'linear_solver':'mumps'})  ## fine
     solve(A, uh.vector(),b)
-    Ws = inner(sigma(uh,rhoh,penal), epsilon(uh))
-    comp = assemble(Ws*dx)
-
+    comp = assemble(Ws)
+
+    ## final design always ends the series, with the fine displacement
+    series.write(loop, cell=dict(density=field(rhoh)),
+                 node=dict(displacement=uh.compute_vertex_values(mesh).reshape(dim, -1).T))
+    series.close()
+    if events is not None:
+        events.close()
     if dim == 2:
         plot(rhoh, cmap = "gray_r")
         plt.savefig("test"+'.png')
@@ -338,32 +577,39 @@ def main(volfrac, maxiter, N, hmax, hamxC, rmin, Ni, Nf, Wi, Wu, target_step_per
         plt.plot(data_size)
         plt.savefig("data.png")
     else:
-        XDMFFile("/workspace/results/displacement.xdmf").write(uh)
-        XDMFFile("/workspace/results/sensitivity.xdmf").write(dc)
-        XDMFFile("/workspace/results/density.xdmf").write(rhoh)
-        den = pd.DataFrame(rhoh.vector()[:], columns = ['rhoh'])
-        den.to_csv("/workspace/results/density.csv", index = False)
-        cord = pd.DataFrame(center[:,0], columns = ['x'])
-        cord['y'] = center[:,1]
-        cord['z'] = center[:,2]
-        cord.to_csv("/workspace/results/center.csv", index = False)
-        pd.DataFrame(mesh.coordinates()).to_csv('/workspace/results/nodes.csv', index=False, header=False)
-        pd.DataFrame(mesh.cells()).to_csv('/workspace/results/cells.csv', index=False, header=False)
         obj = pd.DataFrame(np.array(obj_hist)[:,0], columns = ['iteration'])
         obj['obj'] = np.array(obj_hist)[:,1]
-        obj.to_csv("/workspace/results/obj.csv", index = False)
+        obj.to_csv(os.path.join(results_dir, "obj.csv"), index = False)
+
+    if net is not None:
+        save_model(os.path.join(results_dir, "model.pt"), net, n_hidden, n_layer, scaler, scalers, lb, meta)
 
-    f = open("/workspace/results/results.txt",'w')
+    TIMER.to_json(os.path.join(results_dir, "timing.json"))   ## all phases with counts, percentiles and peak RSS growth
+    TIMER.to_csv(os.path.join(results_dir, "timing.csv"))
+    f = open(os.path.join(results_dir, "results.txt"),'w')
     print("fine :", mesh.num_cells(),",","Coarse :", meshC.num_entities(0),",","Patch :", len(part_info['nodes']), file = f)
     print(f"total time.: {t_end:.4e},\tfinal comp.: {comp:.4e}", file=f)
-    print("data :", np.round(sum(t_data)), file = f)
-    print("fine :", np.round(sum(t_fine)), ",call :", len(t_fine), ",once :", np.round(sum(t_fine)/len(t_fine),3), file = f)
-    print("coarse :", np.round(sum(t_coarse)), ",call :", len(t_coarse), ",once :", np.round(sum(t_coarse)/len(t_coarse),3), file = f)
-    print("overhead :", np.round(sum(t_overhead)), file = f)
-    print("training :", np.round(sum(t_training)), ",call :", len(t_training), ",once :", np.round(sum(t_training)/len(t_training),3), file = f)
-    print("pred :", np.round(sum(t_pred)), ",call :", len(t_pred), ",once :", np.round(sum(t_pred)/len(t_pred),3), file = f)
-    print("optimizer :", np.round(sum(t_optimizer)), ",call :", len(t_optimizer), ",once :", np.round(sum(t_optimizer)/len(t_optimizer),3), file = f)
+    print("setup :", np.round(setup.t_setup,3), ",cached :", setup.cache_hit, ",per iteration :", np.round((t_end-setup.t_setup)/max(loop,1),3), file = f)
+    for name in ("data", "fine", "coarse", "overhead", "training", "pred", "optimizer"):
+        calls = max(TIMER.count(name), 1)
+        print(name, ":", np.round(TIMER.total(name)), ",call :", TIMER.count(name), ",once :", np.round(TIMER.total(name)/calls,3), file = f)
+    if trainer is not None:
+        print("background training :", np.round(sum(trainer.t_training)), ",call :", len(trainer.t_training), file = f)
     print("hmax : ",hmax, "rmin : ", rmin, file=f)
+    print("mode :", "surrogate" if surrogate else "baseline", ",fine solves :", TIMER.count("fine"),
+          ",peak rss MB :", np.round(peak_rss()/1024, 1), file=f)
+    if scheduler.theta is not None:
+        print("last theta error :", np.round(scheduler.theta,3), ",fine triggers :", scheduler.reason, file=f)
+    if tracker.skip_ratio:
+        print("patch skip ratio :", np.round(np.mean(tracker.skip_ratio),3), file=f)
+    if termination.reason is not None:
+        print("converged :", termination.reason, file=f)
+    if gcmma is not None:
+        print("gcmma inner :", sum(gcmma.inner), ",outer :", len(gcmma.inner), file=f)
+    with open(os.path.join(results_dir, "run.json"), "w") as fj:   ## machine-readable summary (benchmarks/scaling.py)
+        json.dump(dict(mode="surrogate" if surrogate else "baseline", geometry=geometry, hmax=hmax, cells=mesh.num_cells(),
+                       iterations=loop, total=t_end, setup=setup.t_setup, fine_solves=TIMER.count("fine"),
+                       comp=float(comp), peak_rss_kb=peak_rss(), phases=TIMER.totals()), fj, indent=1)
 
     # print("fine :", mesh.num_cells(),",","Coarse :", meshC.num_entities(0),",","Patch :", len(part_info['nodes']))
     # print(f"total time.: {t_end:.4e},\tfinal comp.: {comp:.4e}")
@@ -378,29 +624,31 @@ def main(volfrac, maxiter, N, hmax, hamxC, rmin, Ni, Nf, Wi, Wu, target_step_per
 
 
 if __name__ == "__main__":
-    ## parameters
-    volfrac = 0.15
-    maxiter = 300
-    N = 200   ## number of elem in patch
-    hmax = 0.09
-    # hmax = 0.01
-    hmaxC = hmax*4
-    # hmaxC = 0.048
-    # rmin = 0.6
-    rmin = hmax*2.5
-    Ni = 15
-    Nf = 5
-    Wi = 10
-    Wu = 5
-    target_step_per_epoch = 10
-    epochs = 3
-    # n_hidden = [600, 600, 600]
-    n_hidden = [512, 1024, 512]
-    n_layer = 3
-    lr = 0.0005
-    optimizer = 1   ####   0 --> MMA,   1 --> OC
-    continuation = False
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint")
+    parser.add_argument("--geometry", default=DEFAULTS['geometry'])
+    parser.add_argument("--hmax", type=float, default=DEFAULTS['hmax'])
+    parser.add_argument("--maxiter", type=int, default=DEFAULTS['maxiter'])
+    parser.add_argument("--baseline", action="store_true", help="pure FE: fine sensitivity every iteration, no surrogate")
+    parser.add_argument("--convergence", action="store_true", help="stop early once the stop tests (CONVERGENCE) pass")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=JSON",
+                        help="override a DEFAULTS entry, e.g. --set async_training=true --set 'schedule={\"adaptive\": true}'")
+    parser.add_argument("--results-dir", default="/workspace/results")
+    parser.add_argument("--output-dir", default="/workspace/output", help="scratch directory of the mesh generators")
+    args = parser.parse_args()
+    prepare_output(args.output_dir)
+
+    overrides = dict(item.split("=", 1) for item in args.set)
+    unknown = set(overrides) - set(DEFAULTS)
+    if unknown:
+        parser.error(f"unknown parameters {sorted(unknown)}, expected DEFAULTS keys")
+    run = params(geometry=args.geometry, hmax=args.hmax, maxiter=args.maxiter, surrogate=not args.baseline,
+                 **{k: json.loads(v) for k, v in overrides.items()})
+    if args.convergence:
+        run['convergence'] = CONVERGENCE
     torch.manual_seed(42)
     random.seed(42)
     np.random.seed(42)
-    main(volfrac, maxiter, N, hmax, hmaxC, rmin, Ni, Nf, Wi, Wu, target_step_per_epoch, epochs, n_hidden, n_layer, lr, optimizer, continuation)
\ No newline at end of file
+    main(**run, resume=args.resume, results_dir=args.results_dir,
+         checkpoint=os.path.join(args.results_dir, "checkpoint.pt"),   ## full optimizer state, written atomically (None -> off)
+         telemetry=os.path.join(args.results_dir, "telemetry.jsonl"))   ## per-iteration JSON lines (python -m telemetry summarize ...)
@@ -1,3 +1,4 @@
+import os
 from time import time
 
 import fenics as fe
@@ -6,11 +7,19 @@ import gmsh
 import meshio
 import numpy as np
 
-from utils import line_indices
+from timing import timed
+from utils import PatchIndex, line_indices
 
 TEMP_MESH_PATH = "/workspace/output/tmp_mesh_output.xdmf"
 
 
+def set_scratch_dir(path):
+    ## gmsh -> xdmf hand-over file of the generators below; one directory per process/run
+    global TEMP_MESH_PATH
+    os.makedirs(path, exist_ok=True)
+    TEMP_MESH_PATH = os.path.join(path, "tmp_mesh_output.xdmf")
+
+
 def generate_fenics_mesh(N=None):
     # Synchronize
     gmsh.model.geo.synchronize()
@@ -49,6 +58,7 @@ def generate_fenics_mesh(N=None):
                 part_info['nodes'].append(np.unique(elementNodeTags[0].ravel().astype(int)) - 1)
                 _, comm, _ = np.intersect1d(elementTags, elementTags_, return_indices=True)
                 part_info['elems'].append(comm)
+        part_info['index'] = PatchIndex(part_info['elems'])
         t_part_info = time()-tic
     else:
         part_info = None
@@ -92,6 +102,7 @@ def generate_fenics_mesh_3d(N=None):
                 part_info['nodes'].append(np.unique(elementNodeTags[0].ravel().astype(int)) - 1)
                 _, comm, _ = np.intersect1d(elementTags, elementTags_, return_indices=True)
                 part_info['elems'].append(comm)
+        part_info['index'] = PatchIndex(part_info['elems'])
         t_part_info = time()-tic
     else:
         part_info = None
@@ -107,6 +118,7 @@ def generate_fenics_mesh_3d(N=None):
         file.read(mesh)
     return mesh, part_info, t_part_info
 
+@timed()
 def get_clever2d_mesh(L=2, H=1, hmax=0.1, N=None):
     # Initialize
     gmsh.initialize()
@@ -174,6 +186,7 @@ def get_clever2d_mesh(L=2, H=1, hmax=0.1, N=None):
 
     return mesh, V, F, bcs, t, ds, u, du, rho, drho, part_info, t_part_info
     
+@timed()
 def get_clever3d_mesh(L = 2, H = 1, W = 0.5, hmax = 0.1, N=None):
     gmsh.initialize()
     gmsh.option.setNumber("General.Verbosity", 0)
@@ -276,6 +289,7 @@ def get_clever3d_mesh(L = 2, H = 1, W = 0.5, hmax = 0.1, N=None):
     ds = fe.Measure("ds", domain = mesh, subdomain_data=boundaries)
     
     return mesh, V, F, bcs, t, ds, u, du, rho, drho, part_info, t_part_info
+@timed()
 def get_mbb2d_mesh(L=3, H=1, hmax=0.1, N=None):
     # Initialize
     gmsh.initialize()
@@ -353,6 +367,7 @@ def get_mbb2d_mesh(L=3, H=1, hmax=0.1, N=None):
     return mesh, V, F, bcs, t, ds, u, du, rho, drho, part_info, t_part_info
 
 
+@timed()
 def get_mbb3d_mesh(L=3, H=1, W=0.5, hmax=0.1, N=None):
     gmsh.initialize()
     gmsh.option.setNumber("General.Verbosity", 0)
@@ -505,6 +520,7 @@ def get_mbb3d_mesh(L=3, H=1, W=0.5, hmax=0.1, N=None):
     ds = fe.Measure("ds", domain = mesh, subdomain_data = boundaries)
     return mesh, V, F, bcs, t, ds, u, du, rho, drho, part_info, t_part_info
 
+@timed()
 def get_wrench2d_mesh(L: float = 2, R1: float = 0.5, R2: float = 0.3, r1: float = 0.3, r2: float = 0.175, hmax: float = 0.1, N = None):
     # Initialize
     gmsh.initialize()
@@ -584,6 +600,7 @@ def get_wrench2d_mesh(L: float = 2, R1: float = 0.5, R2: float = 0.3, r1: float
     ds = fe.Measure("ds")(mesh, subdomain_data=boundaries)
     return mesh, V, F, bcs, t, ds, u, du, rho, drho, part_info,t_part_info
 
+@timed()
 def get_lshape2d_mesh(L = 2, H = 2, hmax = 0.1, N =None):
     gmsh.initialize()
     gmsh.option.setNumber("General.Verbosity", 0)
@@ -651,6 +668,7 @@ def get_lshape2d_mesh(L = 2, H = 2, hmax = 0.1, N =None):
     ds = fe.Measure("ds")(mesh, subdomain_data=boundaries)
     return mesh, V, F, bcs, t, ds, u, du, rho, drho, part_info, t_part_info
 
+@timed()
 def get_halfcircle2d_mesh(R= 1, alpha= 0.1, hmax= 0.1, N= None):
     gmsh.initialize()
     gmsh.option.setNumber("General.Verbosity", 0)
@@ -714,6 +732,7 @@ def get_halfcircle2d_mesh(R= 1, alpha= 0.1, hmax= 0.1, N= None):
     ds = fe.Measure("ds")(mesh, subdomain_data=boundaries)
 
     return mesh, V, F, bcs, t, ds, u, du, rho, drho, part_info
+@timed()
 def get_hook2d_mesh(hmax = 0.1, N = None):
     gmsh.initialize()
     gmsh.option.setNumber("General.Verbosity", 0)
@@ -829,6 +848,7 @@ def get_dof_map(F):
     d2v = fe.dof_to_vertex_map(F)
     return v2d, d2v
 
+@timed()
 def get_hook3d_mesh(hmax = 0.1, N = None):
     gmsh.initialize()
     gmsh.option.setNumber("General.Verbosity", 0)
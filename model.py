@@ -1,27 +1,114 @@
 # import matplotlib.pyplot as plt
+import copy
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
 import numpy as np
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch_geometric as pyg
 from matplotlib.tri import Triangulation
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
 from torch.utils.data import random_split
 from torch_geometric.data import Data
 from torch_geometric.utils import subgraph
 from tqdm.auto import tqdm
 
+from timing import timed
 from utils import (convert_neighors_to_edges,
                    create_adjacent_tetrahedra_matrix, find_adjacent_tetrahedra)
 
 
-def generate_data(x, y, edge_ids, elem_ids, mesh):
-    x_by_part = torch.tensor(x[elem_ids], dtype = torch.float)
-    y_by_part = torch.tensor(y[elem_ids], dtype = torch.float)
-    return pyg.data.Data(x=x_by_part, y=y_by_part, edge_index=edge_ids.edge_index, global_idx=torch.tensor(elem_ids.astype(int),dtype=torch.long))
+class HierData(Data):
+    ## patch graph carrying its coarse level: `pool` maps fine cells to local coarse nodes (patch + halo),
+    ## `xc` holds the inputs of those nodes pooled over the whole mesh
+    def __inc__(self, key, value, *args, **kwargs):
+        if key in ('pool', 'coarse_edge_index'):
+            return self.num_coarse
+        return super().__inc__(key, value, *args, **kwargs)
+
+
+def patch_data(edge_ids, xc=None, **kwargs):
+    if 'pool' in edge_ids:
+        return HierData(edge_index=edge_ids.edge_index, pool=edge_ids.pool, xc=xc,
+                        coarse_edge_index=edge_ids.coarse_edge_index, num_coarse=edge_ids.num_coarse, **kwargs)
+    return pyg.data.Data(edge_index=edge_ids.edge_index, **kwargs)
+
+@timed()
+def generate_dataset(x, y, partitioned_graphs, index, mask=None):
+    ## all patches of one snapshot from a single gather over the packed patch index
+    counts = index.counts.tolist()
+    xs = torch.tensor(x[index.elems], dtype = torch.float).split(counts)
+    ys = torch.tensor(y[index.elems], dtype = torch.float).split(counts) if y is not None else [None]*len(counts)
+    global_idx = torch.from_numpy(index.elems.astype(np.int64)).split(counts)
+    xc = coarse_features(x, partitioned_graphs, index) if 'pool' in partitioned_graphs[0] else [None]*len(counts)
+    keep = range(len(counts)) if mask is None else np.flatnonzero(mask)
+    if y is None:
+        return [patch_data(partitioned_graphs[i], xc[i], x=xs[i], global_idx=global_idx[i]) for i in keep]
+    return [patch_data(partitioned_graphs[i], xc[i], x=xs[i], y=ys[i], global_idx=global_idx[i]) for i in keep]
+
+def coarse_features(x, partitioned_graphs, index):
+    ## inputs mean-pooled over the fine cells of every coarse node of the mesh, gathered per patch (own nodes + halo)
+    assign = np.concatenate([g.coarse_nodes.numpy()[g.pool.numpy()] for g in partitioned_graphs])   ## index.elems order
+    n_coarse = max(int(g.coarse_nodes.max()) for g in partitioned_graphs) + 1
+    xe = x[index.elems]
+    counts = np.maximum(np.bincount(assign, minlength=n_coarse), 1)
+    pooled = np.stack([np.bincount(assign, weights=xe[:, j], minlength=n_coarse) for j in range(x.shape[1])], 1)/counts[:, None]
+    return [torch.tensor(pooled[g.coarse_nodes.numpy()], dtype=torch.float) for g in partitioned_graphs]
+
+def inputs(batch, device):
+    ## positional network inputs of a (batched) patch graph
+    if 'pool' in batch:
+        return (batch.x.to(device), batch.edge_index.to(device), batch.pool.to(device), batch.coarse_edge_index.to(device),
+                batch.xc.to(device))
+    return (batch.x.to(device), batch.edge_index.to(device))
+
+
+class PatchTracker:
+    """Caches per-patch predictions and flags patches whose inputs changed."""
 
-def pred_input(x, edge_ids, elem_ids, mesh):
-    x_by_part = torch.tensor(x[elem_ids], dtype = torch.float)
-    return pyg.data.Data(x=x_by_part, edge_index=edge_ids.edge_index, global_idx=torch.tensor(elem_ids.astype(int), dtype=torch.long))
+    def __init__(self, index, n_cells, tol=1e-3):
+        self.index = index
+        self.tol = tol
+        self.y = np.zeros(n_cells)      ## cached (scaled) predictions
+        self.x_ref = np.zeros((n_cells, 0))  ## inputs at the last prediction of each patch
+        self.valid = np.zeros(len(index), dtype=bool)
+        self.skip_ratio = []
 
+    def reset(self):
+        ## network changed -> every cached prediction is stale
+        self.valid[:] = False
 
+    def update(self, x, record=True):
+        if self.x_ref.shape != x.shape:
+            self.x_ref = np.zeros_like(x)
+            self.valid[:] = False
+        void = ~self.index.reduce_max(x[:, 0] != 0)
+        changed = self.index.reduce_max(np.abs(x - self.x_ref).max(1)) > self.tol
+        dirty = (changed | ~self.valid) & ~void
+        cells = self.index.select(dirty)
+        self.x_ref[cells] = x[cells]
+        self.valid = dirty | (self.valid & ~void)
+        if record:   ## off for predictions that are not surrogate steps (verification, trial points)
+            self.skip_ratio.append(1 - dirty.mean())
+        return dirty, void
+
+
+ARCHS = {}   ## model registry: name -> class(n_input, n_hiddens, n_layer, dropout)
+
+def register(name):
+    def wrap(cls):
+        ARCHS[name] = cls
+        return cls
+    return wrap
+
+
+@register('gcn')
 class MyGNN(torch.nn.Module):
     def __init__(self, n_input, n_hiddens, n_layer, dropout):
         super().__init__()
@@ -49,6 +136,46 @@ class MyGNN(torch.nn.Module):
         # x = self.output_act(self.output(x, edge_index))
         # return -x
 
+@register('hier')
+class HierGNN(torch.nn.Module):
+    """U-Net style GNN: one GCN layer on the fine cells, the wide layers on the
+    coarse mesh (mean-pooled through a cell-to-coarse-node assignment), then
+    unpooled and concatenated with the fine features for the output layer.
+
+    The coarse level of a patch is its own coarse nodes plus a halo of
+    neighbouring ones, and every coarse node also gets the inputs pooled over
+    all fine cells of the mesh (``xc``), so the coarse layers see the load
+    path outside the patch."""
+
+    def __init__(self, n_input, n_hiddens, n_layer, dropout):
+        super().__init__()
+
+        self.input = pyg.nn.GCNConv(n_input, n_hiddens[0])
+        self.input_act = torch.nn.LeakyReLU()
+        self.coarse_input = pyg.nn.GCNConv(n_input, n_hiddens[0])
+        self.coarse_act = torch.nn.LeakyReLU()
+        self.dropout = torch.nn.ModuleList()
+        self.hidden = torch.nn.ModuleList()
+        self.hidden_act = torch.nn.ModuleList()
+
+        for i in range(1, len(n_hiddens)):
+            self.hidden.append(pyg.nn.GCNConv(n_hiddens[i-1], n_hiddens[i]))
+            self.dropout.append(torch.nn.Dropout(p=dropout))
+            self.hidden_act.append(torch.nn.LeakyReLU())
+        self.output = pyg.nn.GCNConv(n_hiddens[0] + n_hiddens[-1], 1)
+
+    def forward(self, x, edge_index, pool, coarse_edge_index, xc):
+        x = self.input_act(self.input(x, edge_index))
+        ## halo nodes have no cell of the patch pooled to them, only their global inputs
+        xc = self.coarse_act(self.coarse_input(xc, coarse_edge_index)) + \
+            pyg.utils.scatter(x, pool, dim=0, dim_size=xc.shape[0], reduce='mean')
+        for layer, drop, act in zip(self.hidden, self.dropout, self.hidden_act):
+            xc = layer(xc, coarse_edge_index)
+            xc = drop(xc)
+            xc = act(xc)
+        return self.output(torch.cat([x, xc[pool]], dim=1), edge_index)
+
+@register('gcn_fe')
 class MyGNN2(torch.nn.Module):
     def __init__(self, n_input, n_hiddens, n_layer, dropout):
         super().__init__()
@@ -83,16 +210,97 @@ class MyGNN2(torch.nn.Module):
             x = act(x)
         return self.output(x,edge_index)
     
-def training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net=None):
+@register('sage')
+class SageGNN(torch.nn.Module):
+    def __init__(self, n_input, n_hiddens, n_layer, dropout):
+        super().__init__()
+
+        self.input = pyg.nn.SAGEConv(n_input, n_hiddens[0])
+        self.input_act = torch.nn.LeakyReLU()
+        self.dropout = torch.nn.ModuleList()
+        self.hidden = torch.nn.ModuleList()
+        self.hidden_act = torch.nn.ModuleList()
+
+        for i in range(1, len(n_hiddens)):
+            self.hidden.append(pyg.nn.SAGEConv(n_hiddens[i-1], n_hiddens[i]))
+            self.dropout.append(torch.nn.Dropout(p=dropout))
+            self.hidden_act.append(torch.nn.LeakyReLU())
+        self.output = pyg.nn.SAGEConv(n_hiddens[-1], 1)
+
+    def forward(self, x, edge_index):
+        x = self.input_act(self.input(x, edge_index))
+        for layer, drop, act in zip(self.hidden, self.dropout, self.hidden_act):
+            x = layer(x, edge_index)
+            x = drop(x)
+            x = act(x)
+        return self.output(x,edge_index)
+
+@register('gin')
+class GinGNN(torch.nn.Module):
+    def __init__(self, n_input, n_hiddens, n_layer, dropout):
+        super().__init__()
+
+        def mlp(n_in, n_out):
+            return torch.nn.Sequential(torch.nn.Linear(n_in, n_out), torch.nn.LeakyReLU(), torch.nn.Linear(n_out, n_out))
+        self.input = pyg.nn.GINConv(mlp(n_input, n_hiddens[0]))
+        self.input_act = torch.nn.LeakyReLU()
+        self.dropout = torch.nn.ModuleList()
+        self.hidden = torch.nn.ModuleList()
+        self.hidden_act = torch.nn.ModuleList()
+
+        for i in range(1, len(n_hiddens)):
+            self.hidden.append(pyg.nn.GINConv(mlp(n_hiddens[i-1], n_hiddens[i])))
+            self.dropout.append(torch.nn.Dropout(p=dropout))
+            self.hidden_act.append(torch.nn.LeakyReLU())
+        self.output = torch.nn.Linear(n_hiddens[-1], 1)
+
+    def forward(self, x, edge_index):
+        x = self.input_act(self.input(x, edge_index))
+        for layer, drop, act in zip(self.hidden, self.dropout, self.hidden_act):
+            x = layer(x, edge_index)
+            x = drop(x)
+            x = act(x)
+        return self.output(x)
+
+@register('mlp')
+class AggMLP(torch.nn.Module):
+    ## parameter-free K-hop mean aggregation (SGC/SIGN style), then a plain MLP per cell
+    def __init__(self, n_input, n_hiddens, n_layer, dropout, hops=3):
+        super().__init__()
+        self.hops = hops
+        self.n_input = n_input
+        layers = []
+        n_in = n_input*(hops + 1)
+        for n_hidden in n_hiddens:
+            layers += [torch.nn.Linear(n_in, n_hidden), torch.nn.Dropout(p=dropout), torch.nn.LeakyReLU()]
+            n_in = n_hidden
+        layers.append(torch.nn.Linear(n_in, 1))
+        self.mlp = torch.nn.Sequential(*layers)
+
+    def forward(self, x, edge_index):
+        feats = [x]
+        for _ in range(self.hops):
+            x = pyg.utils.scatter(x[edge_index[0]], edge_index[1], dim=0, dim_size=x.shape[0], reduce='mean')
+            feats.append(x)
+        return self.mlp(torch.cat(feats, dim=1))
+
+def autocast(device, precision):
+    ## opt-in reduced precision for the GCN matmuls; weights, loss and optimizer stay float32
+    return torch.autocast(device.type, dtype=torch.bfloat16, enabled=precision == 'bf16')
+
+@timed("train")   ## distinct from main.py's "training" phase, background runs record here
+def training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net=None, n_procs=1, precision='fp32', arch='gcn', stop=None):
     dataset_size = len(dataset)
     train_size = int(dataset_size*0.8)
     validation_size = int(dataset_size-train_size)
     train_dataset, validation_dataset = random_split(dataset, [train_size, validation_size])
+    if net is None:
+        net = ARCHS[arch](dataset[0]['x'].shape[1], n_hidden, n_layer, 0.1).to(device)
+    if n_procs > 1 and device.type == 'cpu':
+        return training_ddp(list(train_dataset), list(validation_dataset), batch_size, lr, epochs, net, n_procs, precision)
 
     train_loader = pyg.loader.DataLoader(train_dataset, batch_size = batch_size)
     validation_loader = pyg.loader.DataLoader(validation_dataset, batch_size = batch_size)
-    if net is None:
-        net = MyGNN(dataset[0]['x'].shape[1], n_hidden, n_layer, 0.1).to(device)
     optim = torch.optim.Adam(net.parameters(), lr=lr)
     # scheduler = torch.optim.lr_scheduler.StepLR(optim, step_size=50, gamma=0.9)
     criterion = torch.nn.L1Loss()
@@ -105,9 +313,12 @@ def training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net=Non
         net.train()
         running_loss = 0.0
         for batch in train_loader:
+            if stop is not None and stop.is_set():   ## cancelled (BackgroundTrainer.shutdown), the result is discarded
+                return train_history, val_history, net
             optim.zero_grad()
-            yhat = net(batch.x.to(device), batch.edge_index.to(device))
-            loss = criterion(yhat, batch.y.to(device))
+            with autocast(device, precision):
+                yhat = net(*inputs(batch, device))
+            loss = criterion(yhat.float(), batch.y.to(device))
             loss.backward()
             optim.step()
             running_loss += loss.item()
@@ -117,8 +328,9 @@ def training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net=Non
             net.eval()
             running_loss = 0.0
             for batch in validation_loader:
-                yhat = net(batch.x.to(device), batch.edge_index.to(device))
-                loss = criterion(yhat, batch.y.to(device))
+                with autocast(device, precision):
+                    yhat = net(*inputs(batch, device))
+                loss = criterion(yhat.float(), batch.y.to(device))
                 running_loss += loss.item()
         val_loss = running_loss/len(train_loader)
         val_history.append(val_loss)
@@ -129,6 +341,172 @@ def training(dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net=Non
         pbar.set_postfix_str(f'loss={train_loss:.3e}/{val_loss:.3e}')
     return train_history, val_history, net
 
+@timed()
+def predict(net, x, tracker, partitioned_graphs, index, scalers, device, mc_samples=0, runner=None, record=True):
+    dirty, void = tracker.update(x, record)  ## only re-predict patches whose inputs changed
+    pred_input_data = generate_dataset(x, None, partitioned_graphs, index, dirty)
+    var = 0.0
+    if pred_input_data:
+        # pred_loader = pyg.loader.DataLoader(pred_input_data, batch_size = batch_size*2)
+        pred_loader = pyg.loader.DataLoader(pred_input_data, batch_size = len(pred_input_data))
+        with torch.no_grad():
+            net.eval()
+            for batch in pred_loader:
+                if mc_samples:
+                    yhat, std = mc_dropout(net, inputs(batch, device), mc_samples)
+                    var = std.mean().item()
+                else:
+                    yhat = (runner or net)(*inputs(batch, device))
+                tracker.y[batch.global_idx] = yhat.cpu().numpy()[:, 0]
+    if void.any():
+        y_void = scalers.transform(np.zeros((1,1)))[0,0]   ## zero sensitivity in void patches
+        tracker.y[index.select(void)] = y_void
+    dc = scalers.inverse_transform(tracker.y.reshape(-1,1)).ravel()
+    dc[dc > 0] = 0
+    return dc, var
+
+def training_ddp(train_dataset, validation_dataset, batch_size, lr, epochs, net, n_procs, precision='fp32'):
+    ## data-parallel CPU training: patches sharded by rank, gradients averaged over gloo
+    n_procs = min(n_procs, len(train_dataset))
+    train_dataset = train_dataset[:len(train_dataset) - len(train_dataset) % n_procs]  ## equal steps on every rank
+    net.share_memory()
+    history = torch.zeros(2, epochs).share_memory_()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    n_threads = max(torch.get_num_threads()//n_procs, 1)
+    mp.start_processes(_ddp_worker, args=(n_procs, n_threads, train_dataset, validation_dataset, batch_size, lr, epochs, net, history, precision),
+                       nprocs=n_procs, join=True, start_method='fork')
+    return history[0].tolist(), history[1].tolist(), net
+
+def _ddp_worker(rank, n_procs, n_threads, train_dataset, validation_dataset, batch_size, lr, epochs, net, history, precision):
+    torch.set_num_threads(n_threads)
+    dist.init_process_group("gloo", rank=rank, world_size=n_procs)
+    ddp = torch.nn.parallel.DistributedDataParallel(copy.deepcopy(net))
+    local_batch_size = int(np.ceil(batch_size/n_procs))
+    train_loader = pyg.loader.DataLoader(train_dataset[rank::n_procs], batch_size = local_batch_size)
+    validation_loader = pyg.loader.DataLoader(validation_dataset[rank::n_procs], batch_size = local_batch_size)
+    optim = torch.optim.Adam(ddp.parameters(), lr=lr)
+    criterion = torch.nn.L1Loss()
+
+    for epoch in range(epochs):
+        ddp.train()
+        running_loss = 0.0
+        for batch in train_loader:
+            optim.zero_grad()
+            with autocast(torch.device('cpu'), precision):
+                yhat = ddp(*inputs(batch, torch.device('cpu')))
+            loss = criterion(yhat.float(), batch.y)
+            loss.backward()
+            optim.step()
+            running_loss += loss.item()
+        with torch.no_grad():
+            ddp.eval()
+            val_loss = 0.0
+            for batch in validation_loader:
+                with autocast(torch.device('cpu'), precision):
+                    yhat = ddp.module(*inputs(batch, torch.device('cpu')))
+                val_loss += criterion(yhat.float(), batch.y).item()
+            losses = torch.tensor([running_loss, val_loss])/max(len(train_loader), 1)
+            dist.all_reduce(losses)
+        if rank == 0:
+            history[:, epoch] = losses/n_procs
+    if rank == 0:
+        with torch.no_grad():
+            for p, q in zip(net.parameters(), ddp.module.parameters()):
+                p.copy_(q)
+    dist.destroy_process_group()
+
+def mc_dropout(net, x, n_samples):
+    ## Monte-Carlo dropout: sample the network with its dropout layers active
+    net.eval()
+    for module in net.modules():
+        if isinstance(module, torch.nn.Dropout):
+            module.train()
+    with torch.no_grad():
+        samples = torch.stack([net(*x) for _ in range(n_samples)])
+    net.eval()
+    return samples.mean(0), samples.std(0)
+
+class BackgroundTrainer:
+    """Runs `training` on a worker thread so the optimization loop keeps going.
+
+    The network is deep-copied at submission, so the caller keeps predicting with
+    its current model; `poll` hands back the retrained one once it is ready.
+    `shutdown(cancel=True)` stops a running job after its current batch.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stop = threading.Event()
+        self.future = None
+        self.t_training = []
+
+    @property
+    def busy(self):
+        return self.future is not None
+
+    def submit(self, dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net=None, n_procs=1, precision='fp32', arch='gcn'):
+        if self.busy:
+            return False
+        net = copy.deepcopy(net) if net is not None else None
+        self.future = self.executor.submit(self._run, dataset, batch_size, n_hidden, n_layer, lr, epochs, device, net, n_procs, precision, arch)
+        return True
+
+    def _run(self, *args):
+        tic = time()
+        result = training(*args, stop=self.stop)
+        return result, time()-tic
+
+    def poll(self, wait=False):
+        if self.future is None or not (wait or self.future.done()):
+            return None
+        result, t = self.future.result()
+        self.future = None
+        self.t_training.append(t)
+        return result
+
+    def shutdown(self, cancel=False):
+        if cancel:
+            self.stop.set()
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+
+def n_input(net):
+    if isinstance(net, AggMLP):
+        return net.n_input
+    if isinstance(net, MyGNN2):
+        return net.feature_extractor[0].in_features
+    if isinstance(net, GinGNN):
+        return net.input.nn[0].in_features
+    return net.input.in_channels
+
+def model_state(net, n_hidden, n_layer, scaler, scalers, lb, meta=None):
+    return {
+        'state_dict': net.state_dict(),
+        'arch': next(name for name, cls in ARCHS.items() if type(net) is cls),
+        'n_input': n_input(net),
+        'n_hidden': list(n_hidden),
+        'n_layer': n_layer,
+        'scaler': scaler,    ## input MinMaxScaler
+        'scalers': scalers,  ## output MinMaxScaler
+        'lb': lb,            ## output outlier bound
+        'meta': meta or {},  ## geometry, hmax, rmin, patch size, ...
+    }
+
+def save_model(path, net, n_hidden, n_layer, scaler, scalers, lb, meta=None):
+    torch.save(model_state(net, n_hidden, n_layer, scaler, scalers, lb, meta), path)
+
+def load_model(path, device):
+    return model_from_state(torch.load(path, map_location=device, weights_only=False), device)
+
+def model_from_state(ckpt, device):
+    net = ARCHS[ckpt.get('arch', 'gcn')](ckpt['n_input'], ckpt['n_hidden'], ckpt['n_layer'], 0.1).to(device)
+    net.load_state_dict(ckpt['state_dict'])
+    return net, ckpt['scaler'], ckpt['scalers'], ckpt['lb'], ckpt['meta']
+
+@timed()
 def partition_graph(subset, data):
     if not isinstance(subset, torch.Tensor):
         subset = torch.tensor(subset, dtype=torch.long)
@@ -140,7 +518,36 @@ def partition_graph(subset, data):
         edge_index=dummy[edge_index_]
     )
 
-def graph_partitioning(coords, trias, part_info, center, mesh):
+def coarse_patches(assign, edges, n_coarse, elems, halo=3):
+    ## per patch: the coarse nodes its cells pool to plus `halo` rings of neighbours in the global coarse graph
+    ## (as many as HierGNN has coarse layers), numbered locally in ascending global order
+    adj = csr_matrix((np.ones(edges.shape[1]), (edges[0], edges[1])), shape=(n_coarse, n_coarse))
+    coarse_graph = Data(
+        x=torch.zeros(n_coarse, 1),
+        edge_index=torch.tensor(edges, dtype=torch.long)
+    )
+    partitioned = []
+    for subset in elems:
+        nodes = np.unique(assign[subset])
+        for _ in range(halo):
+            nodes = np.union1d(nodes, adj[nodes].indices)
+        pool = np.searchsorted(nodes, assign[subset])
+        partitioned.append((torch.tensor(pool, dtype=torch.long), partition_graph(nodes, coarse_graph).edge_index,
+                            len(nodes), torch.tensor(nodes, dtype=torch.long)))
+    return partitioned
+
+@timed()
+def coarse_partitioning(center, meshC, part_info, halo=3):
+    ## assign every fine cell to its nearest coarse vertex and cut the coarse graph per patch, with a halo
+    coordsC = meshC.coordinates()
+    _, assign = cKDTree(coordsC).query(center)
+    cells = meshC.cells()
+    k = cells.shape[1]
+    pairs = np.unique(np.concatenate([cells[:, [i, j]] for i in range(k) for j in range(k) if i != j]), axis=0)
+    return coarse_patches(assign, pairs.T, len(coordsC), part_info['elems'], halo)
+
+@timed()
+def graph_partitioning(coords, trias, part_info, center, mesh, meshC=None):
     if coords.shape[1] == 2:
         T = Triangulation(*coords.T, triangles=trias)
         edge_index = np.concatenate([convert_neighors_to_edges(eid, neighbors) for eid, neighbors in enumerate(T.neighbors)]).T
@@ -153,4 +560,41 @@ def graph_partitioning(coords, trias, part_info, center, mesh):
         edge_index=torch.tensor(edge_index, dtype=torch.long)
     )
     partitioned_graphs = [partition_graph(subset, global_graph) for subset in part_info['elems']]
-    return partitioned_graphs
\ No newline at end of file
+    if meshC is not None:   ## coarse level for HierGNN
+        for graph, (pool, coarse_edge_index, num_coarse, coarse_nodes) in zip(partitioned_graphs, coarse_partitioning(center, meshC, part_info)):
+            graph.pool = pool
+            graph.coarse_edge_index = coarse_edge_index
+            graph.num_coarse = num_coarse
+            graph.coarse_nodes = coarse_nodes   ## global ids, for coarse_features
+    return partitioned_graphs
+
+def pack_graphs(partitioned_graphs):
+    ## patch graphs -> flat int32 arrays with per-patch offsets (the node features are center[elems])
+    out = {'edge_index': np.concatenate([g.edge_index.numpy() for g in partitioned_graphs], 1).astype(np.int32),
+           'edge_offsets': np.r_[0, np.cumsum([g.edge_index.shape[1] for g in partitioned_graphs])]}
+    if 'pool' in partitioned_graphs[0]:
+        out['pool'] = np.concatenate([g.pool.numpy() for g in partitioned_graphs]).astype(np.int32)
+        out['coarse_edge_index'] = np.concatenate([g.coarse_edge_index.numpy() for g in partitioned_graphs], 1).astype(np.int32)
+        out['coarse_offsets'] = np.r_[0, np.cumsum([g.coarse_edge_index.shape[1] for g in partitioned_graphs])]
+        out['num_coarse'] = np.array([g.num_coarse for g in partitioned_graphs])
+        out['coarse_nodes'] = np.concatenate([g.coarse_nodes.numpy() for g in partitioned_graphs]).astype(np.int32)
+    return out
+
+def unpack_graphs(packed, center, part_info):
+    ## inverse of pack_graphs, same tensors as graph_partitioning
+    x = torch.tensor(center)
+    index = part_info['index']
+    e = packed['edge_offsets']
+    n = np.r_[0, np.cumsum(packed['num_coarse'])] if 'pool' in packed else None
+    graphs = []
+    for i, subset in enumerate(part_info['elems']):
+        graph = Data(x=x[torch.as_tensor(subset, dtype=torch.long)],
+                     edge_index=torch.tensor(packed['edge_index'][:, e[i]:e[i+1]], dtype=torch.long))
+        if 'pool' in packed:
+            c = packed['coarse_offsets']
+            graph.pool = torch.tensor(packed['pool'][index.offsets[i]:index.offsets[i+1]], dtype=torch.long)
+            graph.coarse_edge_index = torch.tensor(packed['coarse_edge_index'][:, c[i]:c[i+1]], dtype=torch.long)
+            graph.num_coarse = int(packed['num_coarse'][i])
+            graph.coarse_nodes = torch.tensor(packed['coarse_nodes'][n[i]:n[i+1]], dtype=torch.long)
+        graphs.append(graph)
+    return graphs
@@ -0,0 +1,78 @@
+from time import time
+
+import numpy as np
+
+from cache import ArtifactCache
+from fem import load_area
+from mesh import (get_clever2d_mesh, get_clever3d_mesh, get_dof_map,
+                  get_hook2d_mesh, get_hook3d_mesh, get_lshape2d_mesh,
+                  get_mbb2d_mesh, get_mbb3d_mesh, get_wrench2d_mesh)
+from model import graph_partitioning, pack_graphs, unpack_graphs
+from utils import (compute_tetra_area, compute_triangle_area,
+                   convolution_operator, filter, transfer_operator)
+
+GEOMETRIES = {
+    'clever2d': get_clever2d_mesh, 'clever3d': get_clever3d_mesh,
+    'mbb2d': get_mbb2d_mesh, 'mbb3d': get_mbb3d_mesh,
+    'hook2d': get_hook2d_mesh, 'hook3d': get_hook3d_mesh,
+    'lshape2d': get_lshape2d_mesh, 'wrench2d': get_wrench2d_mesh,
+}
+
+
+class ProblemSetup:
+    """Loop-invariant data of one problem (fine/coarse mesh pair and filter radius).
+
+    Built once per mesh and reused by every iteration: spaces and boundary
+    data of both meshes, the coarse dof map, cell centers and volumes, the
+    filter operator and the filtered volume sensitivity, the load area, the
+    coarse node -> fine cell transfer operator and the patch graphs.
+    With ``cache_dir`` the mesh-derived arrays are stored in and memory-mapped
+    from an ``ArtifactCache`` bundle keyed by the mesh arrays, rmin and the
+    partition; only the meshes and function spaces are always rebuilt.
+    """
+
+    def __init__(self, geometry, hmax, hmaxC, N, rmin, hier=False, cache_dir=None):
+        tic = time()
+        get_mesh = GEOMETRIES[geometry]
+        (self.mesh, self.V, self.F, self.bcs, self.t, self.ds, self.u, self.du,
+         self.rho, self.drho, self.part_info, self.t_part_info) = get_mesh(hmax=hmax, N=N)
+        (self.meshC, self.VC, self.FC, self.bcsC, self.tC, self.dsC, self.uC, self.duC,
+         _, _, _, _) = get_mesh(hmax=hmaxC)
+        self.v2dC, self.d2vC = get_dof_map(self.FC)
+        self.dim = self.u.ufl_shape[0]
+
+        self.coords = self.mesh.coordinates()
+        self.coordsC = self.meshC.coordinates()
+        self.trias = self.mesh.cells()
+        self.center = self.coords[self.trias].mean(1)
+        self.load_area = load_area(self.ds) if self.dim == 3 else None
+        self.load_areaC = load_area(self.dsC) if self.dim == 3 else None
+
+        cache = ArtifactCache(cache_dir) if cache_dir is not None else None
+        index = self.part_info['index']
+        self.cache_key = ArtifactCache.key(self.coords, self.trias, self.coordsC, self.meshC.cells(),
+                                           index.elems, index.counts, rmin=rmin, hier=hier)
+        cached = cache.load(self.cache_key) if cache is not None else None
+        self.cache_hit = cached is not None
+        if cached is not None:
+            self.areas, self.H, self.Hs = cached['areas'], cached['H'], cached['Hs']
+            self.dv_bar, self.transfer = cached['dv_bar'], cached['transfer']
+            self.partitioned_graphs = unpack_graphs(cached, self.center, self.part_info)
+        else:
+            if self.dim == 2:
+                self.areas = compute_triangle_area(self.coords[self.trias])
+            else:
+                self.areas = compute_tetra_area(self.coords[self.trias])
+            self.H = convolution_operator(self.center, rmin).tocsr()
+            self.Hs = self.H@np.ones(self.mesh.num_cells())
+            self.dv_bar = filter(self.H, self.Hs, self.areas)   ## filtered volume sensitivity
+
+            ## 2D interpolates on the coarse triangles, 3D on the Delaunay of the coarse nodes
+            self.transfer = transfer_operator(self.center, self.coordsC, self.meshC.cells() if self.dim == 2 else None)
+            self.partitioned_graphs = graph_partitioning(self.coords, self.trias, self.part_info, self.center,
+                                                         self.mesh, self.meshC if hier else None)
+            if cache is not None:
+                cache.save(self.cache_key, dict(areas=self.areas, H=self.H, Hs=self.Hs, dv_bar=self.dv_bar,
+                                                transfer=self.transfer, **pack_graphs(self.partitioned_graphs)))
+        self.area = self.areas.sum()
+        self.t_setup = time() - tic
@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+
+class SnapshotStore:
+    """Append-only sequence of equally shaped snapshots (one per iteration).
+
+    The newest snapshots are kept in RAM; once ``ram_budget`` bytes are exceeded
+    the oldest ones are spilled to a raw ``np.memmap`` file, so indices
+    [0, n_disk) live on disk and [n_disk, len) in memory. Reads return views.
+    ``pending`` hands the snapshots not yet in the file to another thread
+    (e.g. the checkpoint writer), which persists them while the RAM copies
+    stay in use; the file then also holds some of [n_disk, len).
+    """
+
+    def __init__(self, path, ram_budget=None, reset=True):
+        self.path = path
+        self.ram_budget = ram_budget
+        self.shape = None
+        self.dtype = None
+        self.n_disk = 0
+        self.n_file = 0   ## snapshots in the data file, >= n_disk
+        self._ram = []
+        self._mm = None
+        self._lock = threading.Lock()
+        self.tags = []   ## e.g. the iteration each snapshot belongs to
+        os.makedirs(path, exist_ok=True)
+        if reset:
+            self.clear()
+
+    @property
+    def data_file(self):
+        return os.path.join(self.path, "data.bin")
+
+    @property
+    def meta_file(self):
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def nbytes(self):
+        return int(np.prod(self.shape))*np.dtype(self.dtype).itemsize
+
+    def __len__(self):
+        return self.n_disk + len(self._ram)
+
+    def append(self, arr, tag=None):
+        arr = np.ascontiguousarray(arr)
+        if self.shape is None:
+            self.shape = arr.shape
+            self.dtype = arr.dtype.str
+        assert arr.shape == self.shape, \
+            f"Snapshot shape {arr.shape} does not match store shape {self.shape}."
+        self._ram.append(arr.astype(self.dtype, copy=False))
+        self.tags.append(tag)
+        if self.ram_budget is not None:
+            n_keep = max(int(self.ram_budget//self.nbytes), 0)
+            if len(self._ram) > n_keep:
+                self.spill(len(self._ram) - n_keep)
+
+    def spill(self, count=None):
+        count = len(self._ram) if count is None else count
+        if count == 0:
+            return
+        self._write(self.n_disk, self._ram[:count])
+        del self._ram[:count]
+        self.n_disk += count
+        self._mm = None
+
+    def _write(self, start, arrays):
+        ## snapshots start, start+1, ... at their offsets; those already in the file are skipped.
+        ## Positional writes of identical bytes, so the loop and a persisting thread may overlap
+        with self._lock:
+            skip = max(self.n_file - start, 0)
+        if skip < len(arrays):
+            fd = os.open(self.data_file, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                for i, arr in enumerate(arrays[skip:], start + skip):
+                    os.pwrite(fd, arr.tobytes(), i*self.nbytes)
+            finally:
+                os.close(fd)
+        with self._lock:
+            self.n_file = max(self.n_file, start + len(arrays))
+
+    def _write_meta(self, count, tags):
+        tmp = self.meta_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"shape": list(self.shape) if self.shape else None,
+                       "dtype": self.dtype, "count": count, "tags": tags}, f)
+        os.replace(tmp, self.meta_file)
+
+    def _disk(self):
+        if self._mm is None or len(self._mm) != self.n_disk:
+            self._mm = np.memmap(self.data_file, dtype=self.dtype, mode="r",
+                                 shape=(self.n_disk, *self.shape))
+        return self._mm
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"snapshot index out of range: {i}")
+        if i < self.n_disk:
+            return self._disk()[i]
+        return self._ram[i - self.n_disk]
+
+    def flush(self):
+        ## spill everything and record the layout so the store can be reopened offline
+        self.spill()
+        self._write_meta(self.n_disk, self.tags)
+
+    def pending(self):
+        ## call that persists the current snapshots (and layout) without moving them out of RAM;
+        ## cheap on the calling thread: snapshots are never modified after append, so they are only referenced
+        with self._lock:
+            start = self.n_file
+        arrays = self._ram[start - self.n_disk:]
+        count, tags = len(self), list(self.tags)
+
+        def persist():
+            self._write(start, arrays)
+            self._write_meta(count, tags)
+        return persist
+
+    @classmethod
+    def load(cls, path, ram_budget=None):
+        store = cls(path, ram_budget, reset=False)
+        with open(store.meta_file) as f:
+            meta = json.load(f)
+        store.shape = tuple(meta["shape"]) if meta["shape"] else None
+        store.dtype = meta["dtype"]
+        store.n_disk = store.n_file = meta["count"]   ## anything after count in the file is overwritten
+        store.tags = meta.get("tags", [None]*store.n_disk)
+        return store
+
+    def truncate(self, count):
+        ## drop everything after the first count snapshots (e.g. written after the last checkpoint)
+        self.spill()
+        self.n_disk = self.n_file = min(self.n_disk, count)
+        del self.tags[self.n_disk:]
+        self._mm = None
+        if os.path.exists(self.data_file):
+            os.truncate(self.data_file, self.n_disk*self.nbytes if self.shape else 0)
+
+    def clear(self):
+        self.tags = []
+        self._ram = []
+        self._mm = None
+        self.n_disk = self.n_file = 0
+        for file in (self.data_file, self.meta_file):
+            if os.path.exists(file):
+                os.remove(file)
@@ -0,0 +1,122 @@
+## per-iteration JSON Lines event stream; summarize logs of many runs: python -m telemetry summarize results/*/telemetry.jsonl*
+import argparse
+import glob
+import json
+import os
+import socket
+from collections import defaultdict
+from time import time
+
+import numpy as np
+
+
+class Telemetry:
+    """Appends one JSON object per iteration to ``path``.
+
+    Every record is a complete line written with a single ``write`` and
+    flushed, so ``tail -F`` never sees half a record. Once the file exceeds
+    ``max_bytes`` it is rotated to ``path.1`` (``path.1`` -> ``path.2``, ...,
+    keeping ``backups`` old files) and a new file is started.
+    """
+
+    def __init__(self, path, run=None, max_bytes=64*1024**2, backups=5):
+        self.path = path
+        self.run = run or f"{socket.gethostname()}-{os.getpid()}-{int(time())}"
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a")
+
+    def record(self, **fields):
+        line = json.dumps(dict(run=self.run, time=time(), **fields), default=_jsonable)
+        self._file.write(line + "\n")
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i+1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a")
+
+    def close(self):
+        self._file.close()
+
+
+def _jsonable(v):
+    ## numpy scalars/arrays in the records
+    return v.tolist() if hasattr(v, "tolist") else str(v)
+
+
+def read(paths):
+    ## records of all files, a partly written last line (run still going) is skipped
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def summarize(records):
+    runs = defaultdict(list)
+    for r in records:
+        runs[r["run"]].append(r)
+    rows = []
+    for run, recs in sorted(runs.items()):
+        recs.sort(key=lambda r: r["time"])
+        ## a resumed run repeats the iterations after its last checkpoint, keep the later record of each
+        recs = sorted({r["loop"]: r for r in recs}.values(), key=lambda r: r["time"])
+        seconds = np.array([r["seconds"] for r in recs])
+        gaps = np.diff([r["time"] for r in recs])
+        row = dict(run=run, iterations=len(recs), last_loop=recs[-1]["loop"],
+                   it_per_s=len(recs)/max(seconds.sum(), 1e-12),
+                   stall=gaps.max() if len(gaps) else 0.0, age=time() - recs[-1]["time"],
+                   comp=recs[-1].get("comp"), rss_mb=max(r.get("rss_kb", 0) for r in recs)/1024)
+        for kind in ("fine", "surrogate", "retrain"):
+            dt = np.array([r["seconds"] for r in recs if r["kind"] == kind])
+            row[kind] = len(dt)
+            if len(dt):
+                row[f"{kind}_p50"], row[f"{kind}_p90"], row[f"{kind}_p99"] = np.percentile(dt, [50, 90, 99])
+        phases = defaultdict(float)
+        for r in recs:
+            for name, dt in r.get("phases", {}).items():
+                phases[name] += dt
+        row["phases"] = dict(phases)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary = sub.add_parser("summarize", help="throughput and latency per run")
+    summary.add_argument("paths", nargs="+", help="telemetry files or glob patterns (rotated files included)")
+    summary.add_argument("--out", default=None, help="also write the rows as JSON")
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.paths for p in glob.glob(pattern)})
+    rows = summarize(read(paths))
+    fmt = lambda v: f"{v:.3g}" if isinstance(v, float) else str(v)
+    cols = ["run", "iterations", "last_loop", "it_per_s", "fine", "surrogate", "retrain",
+            "fine_p50", "fine_p99", "surrogate_p50", "surrogate_p99", "stall", "age", "comp", "rss_mb"]
+    print("\t".join(cols))
+    for row in rows:
+        print("\t".join(fmt(row.get(c, "-")) for c in cols))
+    if rows:
+        total = sum(r["iterations"] for r in rows)
+        print(f"{len(rows)} runs, {total} iterations, mean {np.mean([r['it_per_s'] for r in rows]):.3g} it/s per run")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(rows, f, indent=1, default=_jsonable)
+
+
+if __name__ == "__main__":
+    main()
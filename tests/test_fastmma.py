@@ -0,0 +1,44 @@
+## fastmma.MMA against the reference MMA.mmasub on the separable test problem of benchmarks/mma.py
+import numpy as np
+import pytest
+
+import fastmma
+import MMA
+from benchmarks.mma import deviation, run, solver_sub
+
+N = 500
+ITERS = 10
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return run(MMA.mmasub, N, ITERS)[0]
+
+
+def test_float64_matches_mmasub(reference):
+    assert deviation(reference, run(fastmma.mmasub, N, ITERS)[0]) < 1e-6
+
+
+def test_float32_close_to_mmasub(reference):
+    xs = run(fastmma.mmasub, N, ITERS, dtype=np.float32)[0]
+    assert all(x.dtype == np.float64 for x in xs)
+    assert deviation(reference, xs) < 1e-3
+
+
+@pytest.mark.parametrize("threads, chunk", [(2, N//7), (4, N//3), (4, N)])
+def test_threads_match_mmasub(reference, threads, chunk):
+    solver = fastmma.MMA(N, 1, threads=threads, chunk=chunk)   ## uneven chunks, and a single one
+    xs = run(lambda m, n, it, *args: solver_sub(solver, it, *args), N, ITERS)[0]
+    assert deviation(reference, xs) < 1e-6
+
+
+def test_column_outputs():
+    n, m = 50, 1
+    x = 0.3*np.ones((n, 1))
+    out = fastmma.mmasub(m, n, 1, x, np.zeros((n, 1)), np.ones((n, 1)), x, x, 1.0, -np.ones((n, 1)),
+                         np.array([[0.1]]), np.ones((m, n))/n, np.ones((n, 1)), np.ones((n, 1)),
+                         1.0, np.zeros((m, 1)), 1e5*np.ones((m, 1)), np.zeros((m, 1)), 0.2)
+    ref = MMA.mmasub(m, n, 1, x, np.zeros((n, 1)), np.ones((n, 1)), x, x, 1.0, -np.ones((n, 1)),
+                     np.array([[0.1]]), np.ones((m, n))/n, np.ones((n, 1)), np.ones((n, 1)),
+                     1.0, np.zeros((m, 1)), 1e5*np.ones((m, 1)), np.zeros((m, 1)), 0.2)
+    assert [np.shape(v) for v in out] == [np.shape(v) for v in ref]
@@ -0,0 +1,133 @@
+import contextlib
+import cProfile
+import csv
+import functools
+import json
+import os
+import resource
+import threading
+from collections import defaultdict
+from time import perf_counter
+
+import numpy as np
+
+
+class Timer:
+    """Named, nested phase timers.
+
+    ``with timer.phase("fine"):`` records the wall time (``perf_counter``) and
+    the growth of the peak RSS of the block under its path; phases opened
+    inside it are recorded as ``fine/<name>``, so totals of the outer phase
+    include them. Each thread keeps its own nesting stack, a phase entered on
+    a worker thread starts a new path.
+    """
+
+    def __init__(self):
+        self.records = defaultdict(list)   ## path -> [(seconds, peak rss growth in kB)]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        stack = self._stack()
+        stack.append(name)
+        path = "/".join(stack)
+        rss = peak_rss()
+        tic = perf_counter()
+        try:
+            yield
+        finally:
+            dt = perf_counter() - tic
+            stack.pop()
+            with self._lock:
+                self.records[path].append((dt, peak_rss() - rss))
+
+    def timed(self, name=None):
+        ## decorator: every call of the function is a phase (default name: the function name)
+        def wrap(func):
+            label = name or func.__name__
+
+            @functools.wraps(func)
+            def inner(*args, **kwargs):
+                with self.phase(label):
+                    return func(*args, **kwargs)
+            return inner
+        return wrap
+
+    def add(self, name, seconds):
+        ## time measured elsewhere (e.g. the mesh partitioning inside the mesh generators)
+        with self._lock:
+            self.records[name].append((seconds, 0))
+
+    def total(self, path):
+        return sum(dt for dt, _ in self.records.get(path, ()))
+
+    def count(self, path):
+        return len(self.records.get(path, ()))
+
+    def totals(self):
+        ## total seconds of the top-level phases
+        with self._lock:
+            return {path: sum(dt for dt, _ in r) for path, r in self.records.items() if "/" not in path}
+
+    def reset(self):
+        with self._lock:
+            self.records.clear()
+
+    def summary(self):
+        rows = []
+        for path in sorted(self.records):
+            dt = np.array([r[0] for r in self.records[path]])
+            rss = [r[1] for r in self.records[path]]
+            p50, p90, p99 = np.percentile(dt, [50, 90, 99])
+            rows.append(dict(phase=path, depth=path.count("/"), count=len(dt), total=dt.sum(), mean=dt.mean(),
+                             p50=p50, p90=p90, p99=p99, max=dt.max(), rss_kb=max(rss)))
+        return rows
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(dict(phases=self.summary(), peak_rss_kb=peak_rss()), f, indent=1, default=float)
+
+    def to_csv(self, path):
+        rows = self.summary()
+        with open(path, "w", newline="") as f:
+            out = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["phase"])
+            out.writeheader()
+            out.writerows(rows)
+
+
+def peak_rss():
+    ## peak resident set size of the process in kB (Linux units)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@contextlib.contextmanager
+def profile(path, torch_profiler=False):
+    ## cProfile (and optionally torch.profiler) capture of one block, written to <path>.prof / <path>.json
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    prof = cProfile.Profile()
+    with contextlib.ExitStack() as stack:
+        if torch_profiler:
+            import torch
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            tprof = stack.enter_context(torch.profiler.profile(activities=activities, record_shapes=True))
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+    prof.dump_stats(path + ".prof")
+    if torch_profiler:
+        tprof.export_chrome_trace(path + ".json")
+
+
+TIMER = Timer()   ## process-wide timer the hot functions of fem/model/utils/mesh report to
+phase = TIMER.phase
+timed = TIMER.timed
@@ -7,7 +7,9 @@ from fenics_adjoint import Constant
 from matplotlib.tri import Triangulation
 from scipy.interpolate import griddata
 from scipy.sparse import coo_matrix
-from scipy.spatial import cKDTree
+from scipy.spatial import Delaunay, cKDTree
+
+from timing import timed
 
 
 def map_mesh(src_mesh, dst_mesh, values, method: str='nearest'):
@@ -21,21 +23,35 @@ def map_mesh(src_mesh, dst_mesh, values, method: str='nearest'):
 
     return mapped
 
+def field(f):
+    ## writable NumPy view of the local PETSc array of a Function (no copy)
+    return fe.as_backend_type(f.vector()).vec().array
+
+def sync(f):
+    ## finish writes made through field(): assemble, then scatter the owned values to the ghost entries
+    v = fe.as_backend_type(f.vector())
+    v.apply("insert")
+    v.update_ghost_values()
+
+@timed()
 def map_density(rhoh, rhohC, mesh, meshC, v2d=None, v2dC=None):
     src_coords = mesh.coordinates()
     dst_coords = meshC.coordinates()
-    if len(rhoh.vector()[:]) != mesh.coordinates().shape[0]:
+    rho = field(rhoh)
+    if len(rho) != mesh.coordinates().shape[0]:
         src_coords = src_coords[mesh.cells()].mean(1)
     if v2d is None:
-        v2d = np.arange(src_coords.shape[0])
-    rhohC.vector()[v2dC] = map_mesh(
+        v2d = slice(None)
+    field(rhohC)[v2dC] = map_mesh(
         src_coords,
         dst_coords,
-        rhoh.vector()[v2d])
+        rho[v2d])
+    sync(rhohC)
 
+@timed()
 def compute_theta_error(dc, dc_pred):
-    v1 = dc.vector()[:]
-    v2 = dc_pred.vector()[:]
+    v1 = field(dc)
+    v2 = field(dc_pred)
     therr = np.arccos(np.dot(v1, v2)/np.linalg.norm(v1)/np.linalg.norm(v2))*180/np.pi
     return therr
 
@@ -46,13 +62,14 @@ def calculate_center(mesh):
     center = coords[trias].mean(1)
     return center
 
-def filter(H,Hs,x):
-    return (H@x)/Hs
+def filter(H,Hs,x,out=None):   ## not @timed: oc calls it per bisection step, oc and the loop phases time it
+    return np.divide(H@x, Hs, out=out)
 
 def convert_neighors_to_edges(eid, neighbors):
     valid_neighbors = np.setdiff1d(neighbors, -1)
     return np.array([(eid, i) for i in valid_neighbors])
 
+@timed()
 def convolution_operator(center, rmin):
     tree = cKDTree(center)
     pairs = np.array(list(tree.query_pairs(rmin)))
@@ -84,6 +101,30 @@ def tree_maker(center, meshC):
     _, fcc2cn = tree.query(meshC.coordinates())
     return fcc2cn
 
+@timed()
+def transfer_operator(points, coords, cells=None):
+    ## sparse linear interpolation matrix (points x coords): barycentric weights of the
+    ## containing simplex, nearest node for points outside. cells=None -> Delaunay of coords
+    if cells is None:
+        tri = Delaunay(coords)
+        simplex = tri.find_simplex(points)
+        cells = tri.simplices
+    else:
+        simplex = Triangulation(*coords.T, triangles=cells).get_trifinder()(*points.T)
+    d = coords.shape[1]
+    inside = simplex >= 0
+    verts = cells[simplex[inside]]
+    X = coords[verts]
+    Tm = np.transpose(X[:, :d] - X[:, d:], (0, 2, 1))
+    lam = np.linalg.solve(Tm, (points[inside] - X[:, d])[..., None])[..., 0]
+    weights = np.c_[lam, 1 - lam.sum(1)]
+    _, nearest = cKDTree(coords).query(points[~inside])
+    rows = np.r_[np.repeat(np.flatnonzero(inside), d+1), np.flatnonzero(~inside)]
+    cols = np.r_[verts.ravel(), nearest]
+    data = np.r_[weights.ravel(), np.ones(len(nearest))]
+    return coo_matrix((data, (rows, cols)), shape=(len(points), len(coords))).tocsr()
+
+@timed()
 def find_adjacent_tetrahedra(mesh):
     tdim = mesh.topology().dim()  # Topological dimension (3 for tetrahedra)
     mesh.init(tdim, tdim - 1)  # Initialize connectivity between cells and faces
@@ -122,24 +163,42 @@ def line_indices(mesh, flag):
     matching_indices = [index for index, line in enumerate(line_info) if set(line).issubset(idx)]
     return matching_indices
 
+class PatchIndex:
+    ## packed CSR layout of part_info['elems']: one flat int32 cell array plus patch offsets
+    def __init__(self, elems):
+        self.counts = np.array([len(e) for e in elems], dtype=np.int64)
+        self.offsets = np.r_[0, np.cumsum(self.counts)]
+        self.elems = np.concatenate(elems).astype(np.int32)
+        self.owner = np.repeat(np.arange(len(elems)), self.counts)   ## patch of every flat entry
+
+    def __len__(self):
+        return len(self.counts)
+
+    def reduce_min(self, v):
+        return np.minimum.reduceat(v[self.elems], self.offsets[:-1])
+
+    def reduce_max(self, v):
+        return np.maximum.reduceat(v[self.elems], self.offsets[:-1])
+
+    def select(self, mask):
+        ## cells of the patches flagged in mask
+        return self.elems[mask[self.owner]]
+
+@timed()
 def dropping(part_info,x):  ####### only dropout:0
-    N = part_info['elems']
-    den_patch = []
-    for i in range(len(N)):
-        partelem = N[i]
-        if all(x.vector()[partelem]==0) and (random.random()<0.9):
-            den_patch.append(False)
-        else:
-            den_patch.append(True)
+    index = part_info['index']
+    v = field(x)
+    void = (index.reduce_min(v) == 0) & (index.reduce_max(v) == 0)
+    den_patch = np.ones(len(index), dtype=bool)
+    den_patch[void] = [random.random() >= 0.9 for _ in range(void.sum())]   ## same draws as the per-patch loop
     return den_patch
 
+@timed()
 def dropping2(part_info,x):  ####### both dropout:0 and 1
-    N = part_info['elems']
-    den_patch = []
-    for i in range(len(N)):
-        partelem = N[i]
-        if (all(x.vector()[partelem]==0) or all(x.vector()[partelem]==1)) and (random.random()<0.9):
-            den_patch.append(False)
-        else:
-            den_patch.append(True)
-    return den_patch
\ No newline at end of file
+    index = part_info['index']
+    v = field(x)
+    vmin, vmax = index.reduce_min(v), index.reduce_max(v)
+    flat = ((vmin == 0) & (vmax == 0)) | ((vmin == 1) & (vmax == 1))
+    den_patch = np.ones(len(index), dtype=bool)
+    den_patch[flat] = [random.random() >= 0.9 for _ in range(flat.sum())]
+    return den_patch
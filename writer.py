@@ -0,0 +1,144 @@
+import json
+import os
+import queue
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+TOPOLOGY = {3: "Triangle", 4: "Tetrahedron"}   ## by vertices per cell
+
+
+class ResultWriter:
+    """Per-iteration fields as one XDMF time series with raw binary heavy data.
+
+    The mesh (nodes, cells) is written once; ``write`` then appends cell
+    fields (density, sensitivity) and node fields (displacement) of one
+    iteration to ``<path>.bin`` and lists them in ``<path>.xdmf``, which
+    ParaView opens as a time series. Arrays are copied on the calling thread
+    and written by a background thread through a bounded queue, so ``write``
+    only waits when ``maxsize`` steps are already pending.
+
+    With ``resume=t`` an existing series is continued: its steps before time
+    ``t`` are kept, the rest (written after the checkpoint) is dropped.
+    """
+
+    def __init__(self, path, nodes, cells, stride=1, maxsize=4, resume=None):
+        self.path = path
+        self.stride = stride
+        self.error = None
+        self.steps = []   ## (time, [(name, center, (offset, shape, dtype))]) on disk
+        self._offset = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        cells = np.ascontiguousarray(cells, dtype="<i8")
+        self.topology = TOPOLOGY[cells.shape[1]]
+        self.mesh = self._reopen(resume) if resume is not None else None
+        if self.mesh is None:
+            open(self.bin_file, "wb").close()
+            nodes = np.ascontiguousarray(nodes, dtype="<f8")
+            if nodes.shape[1] == 2:
+                nodes = np.hstack([nodes, np.zeros((len(nodes), 1))])   ## XDMF geometry is XYZ
+            self.mesh = [self._append(nodes), self._append(cells)]   ## mesh written once, referenced by every step
+        self._queue = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def bin_file(self):
+        return self.path + ".bin"
+
+    @property
+    def xdmf_file(self):
+        return self.path + ".xdmf"
+
+    def due(self, loop):
+        return self.stride is not None and loop % self.stride == 0
+
+    def write(self, t, cell=None, node=None):
+        fields = [(name, "Cell", np.array(v, dtype="<f8")) for name, v in (cell or {}).items()]
+        for name, v in (node or {}).items():
+            v = np.array(v, dtype="<f8")
+            if v.ndim == 2 and v.shape[1] == 2:
+                v = np.hstack([v, np.zeros((len(v), 1))])   ## 2D vectors padded to 3 components
+            fields.append((name, "Node", v))
+        self._queue.put((t, fields))
+
+    def _append(self, arr):
+        with open(self.bin_file, "ab") as f:
+            f.write(arr.tobytes())
+        item = (self._offset, arr.shape, arr.dtype)
+        self._offset += arr.nbytes
+        return item
+
+    def _reopen(self, t):
+        ## steps of the existing light file before t; the heavy file is cut after the last one kept
+        if not (os.path.exists(self.xdmf_file) and os.path.exists(self.bin_file)):
+            return None
+        grids = [g for g in ET.parse(self.xdmf_file).getroot().iter("Grid") if g.get("GridType") == "Uniform"]
+        if not grids:
+            return None
+        mesh = [_item(grids[0].find("Geometry/DataItem")), _item(grids[0].find("Topology/DataItem"))]
+        for grid in grids:
+            step = json.loads(grid.find("Time").get("Value"))
+            if step < t:
+                self.steps.append((step, [(a.get("Name"), a.get("Center"), _item(a.find("DataItem")))
+                                          for a in grid.findall("Attribute")]))
+        items = mesh + [item for _, fields in self.steps for _, _, item in fields]
+        self._offset = max(offset + int(np.prod(shape))*dtype.itemsize for offset, shape, dtype in items)
+        os.truncate(self.bin_file, self._offset)
+        self.mesh = mesh
+        self._write_xdmf()
+        return mesh
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            t, fields = item
+            try:
+                self.steps.append((t, [(name, center, self._append(v)) for name, center, v in fields]))
+                self._write_xdmf()
+            except Exception as e:   ## keep the loop alive, report at close
+                self.error = e
+
+    def _data_item(self, item):
+        offset, shape, dtype = item
+        kind = "Int" if dtype.kind == "i" else "Float"
+        return (f'<DataItem Format="Binary" DataType="{kind}" Precision="{dtype.itemsize}" Endian="Little" '
+                f'Seek="{offset}" Dimensions="{" ".join(map(str, shape))}">{os.path.basename(self.bin_file)}</DataItem>')
+
+    def _write_xdmf(self):
+        ## the light file is small, rewrite it after every step so a killed run leaves a readable series
+        nodes, cells = self.mesh
+        lines = ['<?xml version="1.0"?>', '<Xdmf Version="3.0">', '<Domain>',
+                 '<Grid Name="series" GridType="Collection" CollectionType="Temporal">']
+        for t, fields in self.steps:
+            lines += [f'<Grid Name="step_{t}" GridType="Uniform">', f'<Time Value="{t}"/>',
+                      f'<Topology TopologyType="{self.topology}" NumberOfElements="{cells[1][0]}">',
+                      self._data_item(cells), '</Topology>',
+                      '<Geometry GeometryType="XYZ">', self._data_item(nodes), '</Geometry>']
+            for name, center, item in fields:
+                kind = "Vector" if len(item[1]) == 2 else "Scalar"
+                lines += [f'<Attribute Name="{name}" AttributeType="{kind}" Center="{center}">',
+                          self._data_item(item), '</Attribute>']
+            lines.append('</Grid>')
+        lines += ['</Grid>', '</Domain>', '</Xdmf>']
+        tmp = self.xdmf_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines))
+        os.replace(tmp, self.xdmf_file)
+
+    def close(self):
+        ## drain the queue and stop the writer
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            print("result writer failed :", self.error)
+
+
+def _item(node):
+    ## DataItem element -> (offset, shape, dtype), the inverse of ResultWriter._data_item
+    kind = "<i" if node.get("DataType") == "Int" else "<f"
+    return (int(node.get("Seek")), tuple(int(d) for d in node.get("Dimensions").split()),
+            np.dtype(kind + node.get("Precision")))